@@ -1,19 +1,33 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import Flask, Request, render_template, request, g, has_request_context, redirect, url_for, flash, session, make_response, send_file, abort
+from markupsafe import Markup, escape
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from flask_wtf.csrf import CSRFProtect
-from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
+from werkzeug.security import generate_password_hash, check_password_hash, safe_join
 from datetime import datetime, timedelta
 from flask_mail import Mail, Message
 import os
-import uuid
 import requests
 import json
+import re
+import tempfile
+import mimetypes
 import random
 import string
 import threading
+import sys
+import types
+import hmac
+from collections import namedtuple
+from contextlib import contextmanager
+import logging
+import queue
+import shutil
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import hashlib
+import time
 from dotenv import load_dotenv
+from itsdangerous import URLSafeTimedSerializer, BadSignature
 
 
 try:
@@ -27,7 +41,17 @@ try:
     import cloudinary.uploader
 except Exception:
     cloudinary = None
-from sqlalchemy import or_, func
+# Optional: Prometheus metrics for /metrics (multiprocess mode under gunicorn)
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except Exception:
+    prometheus_client = None
+from sqlalchemy import or_, func, event, select, literal, insert, delete, case, tuple_
+from sqlalchemy.orm import joinedload, make_transient_to_detached
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import IntegrityError
 from werkzeug.exceptions import RequestEntityTooLarge
 
 # =============================
@@ -50,6 +74,7 @@ ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD')
 # SendGrid (preferred on Render to avoid outbound SMTP blocks)
 SENDGRID_API_KEY = os.getenv('SENDGRID_API_KEY')
 SENDGRID_FROM = os.getenv('SENDGRID_FROM') or os.getenv('MAIL_DEFAULT_SENDER')
+SENDGRID_API_URL = os.getenv('SENDGRID_API_URL', 'https://api.sendgrid.com/v3/mail/send')
 
 
 # Database Configuration
@@ -79,6 +104,10 @@ UPLOAD_FOLDER = os.path.join(basedir, 'static', 'uploads', 'comments')
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+# Deduplicated uploads, named <sha256><ext>; older uploads are <uuid>_<name><ext>
+BLOB_FOLDER = os.path.join(basedir, 'static', 'uploads', 'blobs')
+BLOB_NAME = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]+$')
+LEGACY_UPLOAD_NAME = re.compile(r'^[0-9a-f]{32}_')
 
 # Create upload directory if it doesn't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -113,129 +142,903 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def save_uploaded_file(file, file_type='trek'):
-    """Save uploaded file with unique filename
-    
-    Args:
-        file: The file to save
-        file_type: 'trek' or 'comment' to determine the save location
+# Magic bytes of the accepted image types -> stored extension
+UPLOAD_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'GIF87a', '.gif'),
+    (b'GIF89a', '.gif'),
+)
+UPLOAD_SNIFF_BYTES = 12
+
+def sniff_image_type(head):
+    """Stored extension for the first bytes of an upload, or None if not an accepted image"""
+    for signature, ext in UPLOAD_SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return '.webp'
+    return None
+
+class StagedUpload:
+    """Writable upload target that hashes, type-checks and spools in one pass
+
+    Werkzeug's multipart parser writes each file part into the object returned
+    by Request._get_file_stream; writing straight into the blob folder means
+    save_uploaded_file() only has to rename the file. Anything that doesn't
+    start with an image signature stops being written to disk.
     """
-    if file and allowed_file(file.filename):
-        # Generate unique filename
-        filename = secure_filename(file.filename)
-        name, ext = os.path.splitext(filename)
-        unique_filename = f"{uuid.uuid4().hex}_{name}{ext}"
-        
-        # Try Cloudinary first if enabled
-        if CLOUDINARY_ENABLED and cloudinary is not None:
+
+    def __init__(self, directory):
+        fd, self.path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        self._file = os.fdopen(fd, 'w+b')
+        self._sha = hashlib.sha256()
+        self._head = b''
+        self.size = 0
+        self.ext = None
+        self.rejected = False
+
+    @classmethod
+    def from_stream(cls, stream, directory, chunk_size=64 * 1024):
+        """Stage a stream that was not parsed into a StagedUpload (e.g. in-memory)"""
+        staged = cls(directory)
+        try:
+            while not staged.rejected:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                staged.write(chunk)
+        except Exception:
+            staged.close()
+            raise
+        return staged
+
+    def write(self, data):
+        if self.rejected:
+            return len(data)
+        if self.ext is None:
+            self._head += data[:UPLOAD_SNIFF_BYTES - len(self._head)]
+            if len(self._head) >= UPLOAD_SNIFF_BYTES:
+                self.ext = sniff_image_type(self._head)
+                if self.ext is None:
+                    self.rejected = True
+                    self._file.truncate(0)
+                    return len(data)
+        self._sha.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    @property
+    def valid(self):
+        if self.ext is None and not self.rejected:
+            # Shorter than the sniff window
+            self.ext = sniff_image_type(self._head)
+        return self.ext is not None and not self.rejected
+
+    @property
+    def digest(self):
+        return self._sha.hexdigest()
+
+    def claim(self, dest):
+        """Move the spooled file to its final path; close() then leaves it alone"""
+        self._file.flush()
+        os.replace(self.path, dest)
+        self.path = None
+
+    def close(self):
+        self._file.close()
+        if self.path is not None:
+            _remove_file_quietly(self.path)
+            self.path = None
+
+    def __getattr__(self, name):
+        # read/seek/tell/... for FileStorage and route code
+        return getattr(self._file, name)
+
+class UploadRequest(Request):
+    """Request whose file uploads are spooled straight into the blob folder"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if filename:
             try:
-                folder_map = {
-                    'trek': 'trekmate/treks',
-                    'comment': 'trekmate/comments',
-                    'post': 'trekmate/posts'
-                }
-                folder = folder_map.get(file_type, 'trekmate/uploads')
-                # Cloudinary can read file-like objects
-                upload_res = cloudinary.uploader.upload(
-                    file,
-                    folder=folder,
-                    public_id=os.path.splitext(unique_filename)[0],
-                    resource_type='image',
-                    overwrite=False
-                )
-                url = upload_res.get('secure_url') or upload_res.get('url')
-                if url:
-                    return url
-            except Exception:
-                # Fallback to local save on any Cloudinary error
+                os.makedirs(BLOB_FOLDER, exist_ok=True)
+                return StagedUpload(BLOB_FOLDER)
+            except OSError:
+                # e.g. read-only FS: let werkzeug buffer it as usual
                 pass
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
 
-        if file_type == 'trek':
-            # Use the existing trekimages folder
-            upload_folder = os.path.join(basedir, 'static', 'trekimages')
-        elif file_type == 'comment':
-            # Use the comments upload folder
-            upload_folder = os.path.join(basedir, 'static', 'uploads', 'comments')
-        elif file_type == 'post':
-            # Use the posts upload folder
-            upload_folder = os.path.join(basedir, 'static', 'uploads', 'posts')
-        else:
-            upload_folder = os.path.join(basedir, 'static', 'uploads')
+app.request_class = UploadRequest
+
+def save_uploaded_file(file, file_type='trek'):
+    """Store an upload in the content-addressed blob store and take a reference to it
+
+    Identical bytes are stored (and processed/uploaded) once: the SHA-256 is
+    computed while the request body is parsed (see StagedUpload) and an
+    existing blob is reused. The file type is checked from its magic bytes,
+    not its name. The reference is taken in the current DB transaction, so it
+    is undone if the caller rolls back; pair every saved value with
+    release_upload() when the row that holds it is deleted or repointed.
+
+    Args:
+        file: The file to save
+        file_type: 'trek', 'comment' or 'post' (remote folder / processing)
 
+    Returns the value to store in image_filename (blob filename or remote URL).
+    """
+    if not (file and allowed_file(file.filename)):
+        return None
+
+    staged = file.stream
+    if not isinstance(staged, StagedUpload):
         try:
-            os.makedirs(upload_folder, exist_ok=True)
-            file_path = os.path.join(upload_folder, unique_filename)
-            file.save(file_path)
-
-            # Attempt to compress/resize images for posts/comments
-            if file_type in ('post', 'comment') and Image is not None:
-                try:
-                    ext = ext.lower()
-                    # Open image
-                    with Image.open(file_path) as im:
-                        im_format = im.format
-                        # Convert mode for JPEG if needed
-                        if im.mode in ("P", "RGBA") and (ext in ['.jpg', '.jpeg'] or (im_format and im_format.upper() == 'JPEG')):
-                            im = im.convert('RGB')
-                        # Resize if larger than 1600x1600 preserving aspect ratio
-                        max_size = (1600, 1600)
-                        im.thumbnail(max_size, Image.LANCZOS)
-                        save_kwargs = {}
-                        if ext in ['.jpg', '.jpeg'] or (im_format and im_format.upper() == 'JPEG'):
-                            save_kwargs.update({'quality': 80, 'optimize': True, 'progressive': True})
-                            im.save(file_path, format='JPEG', **save_kwargs)
-                        elif ext in ['.png'] or (im_format and im_format.upper() == 'PNG'):
-                            save_kwargs.update({'optimize': True})
-                            im.save(file_path, format='PNG', **save_kwargs)
-                        else:
-                            # For other formats, try to save with optimize when possible
-                            im.save(file_path)
-                except Exception:
-                    # If optimization fails, keep original file
-                    pass
-
-            return unique_filename
+            os.makedirs(BLOB_FOLDER, exist_ok=True)
+            staged = StagedUpload.from_stream(file.stream, BLOB_FOLDER)
         except Exception:
             # If local save fails (e.g., read-only FS on Render), signal failure
             return None
-    return None
+
+    try:
+        if not staged.valid:
+            return None
+        digest = staged.digest
+        blob = _blob_for_bytes(digest, staged.ext)
+        if blob is None:
+            blob = _create_blob(digest, staged.ext, staged.size, staged, file_type)
+        if not _take_blob_reference(blob.id):
+            # The orphan collector dropped the unreferenced row between the
+            # lookup and the increment: store the bytes again. This transaction
+            # may already hold the write lock (SQLite), so insert through it.
+            db.session.expunge(blob)
+            blob = _create_blob(digest, staged.ext, staged.size, staged, file_type, in_session=True)
+            if blob is None or not _take_blob_reference(blob.id):
+                return None
+            return blob.url or blob.filename
+        if not blob.url and not os.path.exists(os.path.join(BLOB_FOLDER, blob.filename)):
+            # Row survived but the file was lost (e.g. ephemeral disk): restore it
+            # under its raw name and have it processed again
+            # (a blob matched by its processed name already has that name)
+            raw_name = f"{digest}{staged.ext}"
+            staged.claim(os.path.join(BLOB_FOLDER, raw_name))
+            if blob.filename != raw_name:
+                _repoint_image_references(blob.filename, raw_name)
+                blob.filename = raw_name
+                blob.processed_at = None
+        return blob.url or blob.filename
+    except Exception as e:
+        app.logger.error(f"Failed to store upload: {str(e)}")
+        return None
+    finally:
+        # Drops the spooled copy unless it became the blob
+        staged.close()
+
+def _blob_for_bytes(digest, ext):
+    """Blob already holding these bytes: uploaded as they are (digest), or
+    produced by processing another upload (its content-addressed filename)"""
+    return (UploadBlob.query.filter_by(digest=digest).first()
+            or UploadBlob.query.filter_by(filename=f"{digest}{ext}").first())
+
+def _take_blob_reference(blob_id):
+    """Add one reference to a blob; False if its row no longer exists"""
+    return bool(UploadBlob.query.filter_by(id=blob_id)
+                .update({'ref_count': UploadBlob.ref_count + 1}, synchronize_session=False))
+
+def _create_blob(digest, ext, size, staged, file_type, in_session=False):
+    """Stage a new blob on local disk and add its row
+
+    When a remote store is configured the row starts out 'pending' and the
+    background uploader pushes it once image processing is done, so request
+    latency never includes the remote upload.
+    """
+    filename = f"{digest}{ext}"
+    staged.claim(os.path.join(BLOB_FOLDER, filename))
+
+    # Committed on its own connection (with no references yet): the bytes are
+    # already on disk, and blobs left unreferenced by a failed submit are swept
+    # up by the orphan collector. `in_session` inserts in the caller's
+    # transaction instead (under a savepoint).
+    insert_blob = UploadBlob.__table__.insert().values(
+        digest=digest, filename=filename, size=size, kind=file_type,
+        remote_status='pending' if remote_store is not None else None,
+        remote_attempts=0, ref_count=0, created_at=datetime.utcnow()
+    )
+    for _ in range(2):
+        try:
+            if in_session:
+                with db.session.begin_nested():
+                    db.session.execute(insert_blob)
+            else:
+                with db.engine.begin() as conn:
+                    conn.execute(insert_blob)
+        except IntegrityError:
+            # A concurrent request stored the same bytes first, or processing
+            # another upload produced them (same filename); either way the
+            # file is identical. If that row was collected meanwhile, insert again.
+            pass
+        blob = _blob_for_bytes(digest, ext)
+        if blob is not None:
+            return blob
+    raise RuntimeError(f"Could not store blob {filename}")
+
+def _find_blob(value):
+    """UploadBlob for an image_filename value (blob filename or its remote URL)"""
+    if not value:
+        return None
+    if _is_url(value):
+        return UploadBlob.query.filter_by(url=value).first()
+    if not BLOB_NAME.match(value):
+        return None
+    return UploadBlob.query.filter_by(filename=value).first()
+
+def release_upload(value, file_type):
+    """Drop one reference to a stored upload; the file goes when the last one does
+
+    Runs inside the caller's transaction. Files are only removed after that
+    transaction commits, so a rolled-back delete never loses an image.
+    """
+    if not value:
+        return
+    blob = _find_blob(value)
+    if blob is not None:
+        (UploadBlob.query.filter_by(id=blob.id)
+         .update({'ref_count': UploadBlob.ref_count - 1}, synchronize_session=False))
+        removed = (UploadBlob.query
+                   .filter(UploadBlob.id == blob.id, UploadBlob.ref_count <= 0)
+                   .delete(synchronize_session=False))
+        if removed:
+            _remove_after_commit(blob.digest, os.path.join(THUMB_FOLDER, thumbnail_name(blob.filename)))
+            if not blob.url:
+                _remove_after_commit(blob.digest, os.path.join(BLOB_FOLDER, blob.filename))
+    elif not _is_url(value) and LEGACY_UPLOAD_NAME.match(value):
+        # Pre-blob uploads are uuid-named, so exactly one row owns the file
+        _remove_after_commit(None, os.path.join(upload_folder_for(file_type), value))
+
+def _remove_after_commit(digest, path):
+    db.session.info.setdefault('pending_file_removals', []).append((digest, path))
+
+def upload_folder_for(file_type):
+    """Local folder for an upload type ('trek', 'comment' or 'post')"""
+    if file_type == 'trek':
+        # Use the existing trekimages folder
+        return os.path.join(basedir, 'static', 'trekimages')
+    elif file_type == 'comment':
+        # Use the comments upload folder
+        return os.path.join(basedir, 'static', 'uploads', 'comments')
+    elif file_type == 'post':
+        # Use the posts upload folder
+        return os.path.join(basedir, 'static', 'uploads', 'posts')
+    return os.path.join(basedir, 'static', 'uploads')
+
+def upload_path(value, file_type):
+    """Filesystem path of a locally stored image_filename value"""
+    if BLOB_NAME.match(value):
+        return os.path.join(BLOB_FOLDER, value)
+    return os.path.join(upload_folder_for(file_type), value)
+
+UPLOAD_STATIC_PREFIX = {'trek': 'trekimages/', 'comment': 'uploads/comments/', 'post': 'uploads/posts/'}
+
+def upload_url(value, file_type):
+    """URL for an image_filename value: remote URL, deduplicated blob or legacy upload"""
+    if _is_url(value):
+        return value
+    if BLOB_NAME.match(value):
+        return url_for('static', filename='uploads/blobs/' + value)
+    return url_for('static', filename=UPLOAD_STATIC_PREFIX.get(file_type, 'uploads/') + value)
+
+# Catalog trek name -> image in static/trekimages (import_trek_images.py records
+# these in Trek.image_filename; this covers treks it hasn't processed yet)
+TREK_IMAGE_FILES = {
+    'Rajgad Fort': 'rajgad.jpg',
+    'Andharban Jungle Trek': 'andharban.jpg',
+    'Lohagad-Visapur Fort': 'lohagad-visapur.jpg',
+    'Tikona Fort': 'tikona.jpg',
+    'Torna Fort': 'torna.webp',
+    'Rajmachi Fort': 'rajmachi.jpg',
+    'Duke\'s Nose': 'dukes-nose.jpg',
+    'Devkund Waterfall': 'devkund.jpg',
+    'Prabalgad–Kalavantin Durg': 'Prabalgad-kalavanti.jpg',
+    'Irshalgad Fort': 'irshalgad.webp',
+    'Peb–Matheran One Tree Hill': 'one tree hill.jpg',
+    'Karnala Fort': 'karnala.jpg',
+    'Sondai Fort': 'sondai.jpg',
+    'Kalsubai Peak': 'kalsubai.png',
+    'Harihar Fort': 'harihar.png',
+    'Ratangad Fort': 'ratangad.jpg',
+    'Anjaneri–Brahmagiri Hills': 'Anjaneri–Brahmagiri.jpg',
+    'Alang–Madan–Kulang (AMK) Forts': 'Alang–Madan–Kulang.jpg',
+    'Randha Falls': 'randha-falls.jpg',
+    'Ajinkyatara–Sajjangad Forts': 'Ajinkyatara–Sajjangad.jpg',
+    'Kaas Plateau': 'Kaas-Plateau.jpg',
+    'Arthur\'s Seat Trail': 'Arthur_ Seat.jpg',
+    'Thoseghar Waterfalls': 'thoseghar.jpg',
+    'Savlya Ghat': 'savlyaghat.png',
+    'Harishchandragad Fort': 'harishchandragad.png',
+    'Kalu Waterfall': 'kaluwaterfall.png',
+    'Adrai Jungle Trek': 'Aadrai_Jungle_Trek.jpg',
+    'Nanemachi Waterfall': 'nanemachi.webp',
+}
+DEFAULT_TREK_IMAGE = 'img1.png'
 
 def get_trek_image_filename(trek_name):
     """Map trek names to their corresponding image filenames"""
-    # Comprehensive mapping of trek names to image filenames
-    image_mapping = {
-        'Rajgad Fort': 'rajgad.jpg',
-        'Andharban Jungle Trek': 'andharban.jpg',
-        'Lohagad-Visapur Fort': 'lohagad-visapur.jpg',
-        'Tikona Fort': 'tikona.jpg',
-        'Torna Fort': 'torna.webp',
-        'Rajmachi Fort': 'rajmachi.jpg',
-        'Duke\'s Nose': 'dukes-nose.jpg',
-        'Devkund Waterfall': 'devkund.jpg',
-        'Prabalgad–Kalavantin Durg': 'Prabalgad-kalavanti.jpg',
-        'Irshalgad Fort': 'irshalgad.webp',
-        'Peb–Matheran One Tree Hill': 'one tree hill.jpg',
-        'Karnala Fort': 'karnala.jpg',
-        'Sondai Fort': 'sondai.jpg',
-        'Kalsubai Peak': 'kalsubai.png',
-        'Harihar Fort': 'harihar.png',
-        'Ratangad Fort': 'ratangad.jpg',
-        'Anjaneri–Brahmagiri Hills': 'Anjaneri–Brahmagiri.jpg',
-        'Alang–Madan–Kulang (AMK) Forts': 'Alang–Madan–Kulang.jpg',
-        'Randha Falls': 'randha-falls.jpg',
-        'Ajinkyatara–Sajjangad Forts': 'Ajinkyatara–Sajjangad.jpg',
-        'Kaas Plateau': 'Kaas-Plateau.jpg',
-        'Arthur\'s Seat Trail': 'Arthur_ Seat.jpg',
-        'Thoseghar Waterfalls': 'thoseghar.jpg',
-        'Savlya Ghat': 'savlyaghat.png',
-        'Harishchandragad Fort': 'harishchandragad.png',
-        'Kalu Waterfall': 'kaluwaterfall.png',
-        'Adrai Jungle Trek': 'Aadrai_Jungle_Trek.jpg',
-        'Nanemachi Waterfall': 'nanemachi.webp'
+    return TREK_IMAGE_FILES.get(trek_name, DEFAULT_TREK_IMAGE)
+
+# =============================
+# SECTION: Image Variants
+# - Resized WebP/AVIF copies of trek images + <picture>/srcset helper
+# =============================
+IMAGE_VARIANT_WIDTHS = (320, 640, 1024, 1600)
+IMAGE_VARIANT_FORMATS = ()
+if Image is not None:
+    try:
+        from PIL import features as _pil_features
+        # Preferred order: browsers take the first <source> they support
+        IMAGE_VARIANT_FORMATS = tuple(fmt for fmt in ('avif', 'webp') if _pil_features.check(fmt))
+    except Exception:
+        IMAGE_VARIANT_FORMATS = ()
+TREK_IMAGE_FOLDER = os.path.join(basedir, 'static', 'trekimages')
+TREK_VARIANT_FOLDER = os.path.join(TREK_IMAGE_FOLDER, 'variants')
+# Source hashes and outputs of processed catalog images (import_trek_images.py)
+TREK_IMAGE_MANIFEST = os.path.join(TREK_VARIANT_FOLDER, 'manifest.json')
+
+def variant_name(filename, width, fmt):
+    """Variant filename for a source image, e.g. rajgad.jpg -> rajgad.jpg-640.webp
+
+    The source extension stays in the name so rajgad.jpg and rajgad.png don't
+    overwrite each other's variants.
+    """
+    return f"{filename}-{width}.{fmt}"
+
+def variant_source(name):
+    """(source filename, width, fmt) of a variant filename, or None if it isn't one"""
+    stem, _, fmt = name.rpartition('.')
+    source, _, width = stem.rpartition('-')
+    if not source or not width.isdigit():
+        return None
+    return source, int(width), fmt
+
+def generate_image_variants(src_path, out_dir=TREK_VARIANT_FOLDER, widths=IMAGE_VARIANT_WIDTHS, formats=None):
+    """Write resized copies of an image in each modern format; returns the variant filenames
+
+    Never upscales: widths above the source are dropped and the source width is
+    added as the largest variant when it is meaningfully wider than the rest.
+    Kept at module level so it can run in a worker process.
+    """
+    formats = IMAGE_VARIANT_FORMATS if formats is None else formats
+    if Image is None or not formats:
+        return []
+    os.makedirs(out_dir, exist_ok=True)
+    filename = os.path.basename(src_path)
+    written = []
+    with Image.open(src_path) as im:
+        # JPEG can decode at a reduced scale directly, which is much cheaper
+        im.draft('RGB', (max(widths), max(widths)))
+        if im.mode not in ('RGB', 'RGBA'):
+            im = im.convert('RGBA' if 'transparency' in im.info or im.mode in ('LA', 'PA') else 'RGB')
+        src_width = im.width
+        targets = sorted(w for w in widths if w <= src_width)
+        if src_width < max(widths) and (not targets or src_width > targets[-1] * 1.15):
+            targets.append(src_width)
+        for width in targets:
+            height = max(1, round(im.height * width / src_width))
+            resized = im if width == src_width else im.resize((width, height), Image.LANCZOS)
+            for fmt in formats:
+                name = variant_name(filename, width, fmt)
+                tmp_path = os.path.join(out_dir, f".{name}.tmp")
+                resized.save(tmp_path, format=fmt.upper(), quality=55 if fmt == 'avif' else 80)
+                # Readers never see a half-written variant
+                os.replace(tmp_path, os.path.join(out_dir, name))
+                written.append(name)
+    return written
+
+# source filename -> {fmt: [widths]}, rebuilt only when the variants directory changes
+_variant_index = {'mtime': None, 'entries': {}}
+_variant_index_lock = threading.Lock()
+
+def _image_variants(filename):
+    """Available (fmt -> sorted widths) for a trek image filename"""
+    try:
+        mtime = os.stat(TREK_VARIANT_FOLDER).st_mtime_ns
+    except OSError:
+        return {}
+    if mtime != _variant_index['mtime']:
+        with _variant_index_lock:
+            if mtime != _variant_index['mtime']:
+                entries = {}
+                for entry in os.scandir(TREK_VARIANT_FOLDER):
+                    parsed = variant_source(entry.name)
+                    if parsed and parsed[2] in IMAGE_VARIANT_FORMATS:
+                        source, width, fmt = parsed
+                        entries.setdefault(source, {}).setdefault(fmt, []).append(width)
+                for formats in entries.values():
+                    for widths in formats.values():
+                        widths.sort()
+                _variant_index['entries'] = entries
+                _variant_index['mtime'] = mtime
+    return _variant_index['entries'].get(filename, {})
+
+def _cloudinary_width_url(url, width):
+    """Cloudinary delivery URL resized on the fly (f_auto picks WebP/AVIF per browser)"""
+    return url.replace('/upload/', f"/upload/w_{width},c_limit,f_auto,q_auto/", 1)
+
+def trek_picture(trek, sizes='100vw', loading='lazy'):
+    """Render a trek image as <picture> with AVIF/WebP srcsets and the original as fallback"""
+    value = trek.image_filename or get_trek_image_filename(trek.name)
+    fallback = url_for('static', filename='image/img1.png')
+    alt = escape(trek.name)
+    attrs = f'alt="{alt}" loading="{loading}" decoding="async"'
+
+    if _is_url(value):
+        if 'res.cloudinary.com' in value and '/upload/' in value:
+            srcset = ', '.join(f"{_cloudinary_width_url(value, w)} {w}w" for w in IMAGE_VARIANT_WIDTHS)
+            return Markup(f'<img src="{escape(value)}" srcset="{escape(srcset)}" sizes="{escape(sizes)}" {attrs} '
+                          f'onerror="this.onerror=null;this.removeAttribute(\'srcset\');this.src=\'{fallback}\'">')
+        return Markup(f'<img src="{escape(value)}" {attrs} onerror="this.onerror=null;this.src=\'{fallback}\'">')
+
+    original = upload_url(value, 'trek')
+    sources = []
+    for fmt, widths in _image_variants(value).items():
+        srcset = ', '.join(
+            f"{url_for('static', filename='trekimages/variants/' + variant_name(value, w, fmt))} {w}w"
+            for w in widths
+        )
+        sources.append((IMAGE_VARIANT_FORMATS.index(fmt), f'<source type="image/{fmt}" srcset="{escape(srcset)}" sizes="{escape(sizes)}">'))
+    if not sources:
+        return Markup(f'<img src="{original}" {attrs} onerror="this.onerror=null;this.src=\'{fallback}\'">')
+    # On error drop the <source>s too, otherwise the browser keeps choosing them
+    onerror = f"this.onerror=null;this.parentNode.querySelectorAll('source').forEach(function(s){{s.remove()}});this.src='{fallback}'"
+    return Markup('<picture>' + ''.join(tag for _, tag in sorted(sources))
+                  + f'<img src="{original}" {attrs} onerror="{onerror}"></picture>')
+
+# =============================
+# SECTION: Background Image Processing
+# - Uploads are stored raw; a process pool resizes/re-encodes them and
+#   generates variants, then the owning record is updated
+# =============================
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))  # 0 = process inline (dev/tests)
+MAX_UPLOAD_DIMENSIONS = (1600, 1600)
+# Opaque PNG photos above this size are re-encoded as JPEG
+PNG_TO_JPEG_THRESHOLD = 512 * 1024
+# List-view copies of post/comment images (feed cards, comment threads)
+THUMB_FOLDER = os.path.join(basedir, 'static', 'uploads', 'thumbs')
+THUMB_SIZE = (640, 640)
+THUMB_FORMAT = 'webp' if 'webp' in IMAGE_VARIANT_FORMATS else 'jpeg'
+
+def thumbnail_name(filename):
+    """Thumbnail filename for an upload, e.g. <sha256>.png -> <sha256>.webp"""
+    return os.path.splitext(filename)[0] + ('.webp' if THUMB_FORMAT == 'webp' else '.jpg')
+
+def generate_thumbnail(src_path, out_dir=THUMB_FOLDER):
+    """Write the list-view thumbnail for an upload; returns its filename"""
+    name = thumbnail_name(os.path.basename(src_path))
+    os.makedirs(out_dir, exist_ok=True)
+    with Image.open(src_path) as im:
+        im.draft('RGB', (THUMB_SIZE[0] * 2, THUMB_SIZE[1] * 2))
+        if THUMB_FORMAT == 'jpeg':
+            im = im.convert('RGB')
+        elif im.mode not in ('RGB', 'RGBA'):
+            im = im.convert('RGBA')
+        im.thumbnail(THUMB_SIZE, Image.LANCZOS)
+        tmp_path = os.path.join(out_dir, f".{name}.tmp")
+        im.save(tmp_path, format=THUMB_FORMAT.upper(), quality=75)
+    os.replace(tmp_path, os.path.join(out_dir, name))
+    return name
+
+def upload_thumb_url(value, file_type):
+    """List-view URL for a post/comment image; the full image when no thumbnail exists
+
+    Cloudinary images are resized on the fly; local ones use the thumbnail
+    written by process_image() (older uploads and pending jobs have none).
+    """
+    if _is_url(value):
+        if 'res.cloudinary.com' in value and '/upload/' in value:
+            return _cloudinary_width_url(value, THUMB_SIZE[0])
+        return value
+    name = thumbnail_name(value)
+    if os.path.exists(os.path.join(THUMB_FOLDER, name)):
+        return url_for('static', filename='uploads/thumbs/' + name)
+    return upload_url(value, file_type)
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _optimize_upload(file_path):
+    """Resize/re-encode an uploaded post or comment image; returns the final path
+
+    Blobs are never rewritten in place: uploads are served as immutable, so the
+    re-encoded bytes get their own <sha256><ext> name and the caller repoints
+    the rows (the raw file goes once nothing references it).
+    """
+    root, ext = os.path.splitext(file_path)
+    ext = ext.lower()
+    with Image.open(file_path) as im:
+        im_format = (im.format or '').upper()
+        if getattr(im, 'is_animated', False):
+            # Re-saving would keep only the first frame
+            return file_path
+        is_jpeg = ext in ('.jpg', '.jpeg') or im_format == 'JPEG'
+        is_png = ext == '.png' or im_format == 'PNG'
+        opaque = im.mode in ('RGB', 'L') or (im.mode == 'P' and 'transparency' not in im.info)
+        to_jpeg = is_png and opaque and os.path.getsize(file_path) > PNG_TO_JPEG_THRESHOLD
+        if im_format == 'JPEG':
+            # Let libjpeg decode at 1/2..1/8 scale instead of full resolution
+            # (2x headroom keeps the LANCZOS pass below sharp)
+            im.draft('RGB', (MAX_UPLOAD_DIMENSIONS[0] * 2, MAX_UPLOAD_DIMENSIONS[1] * 2))
+        # Convert mode for JPEG if needed
+        if (is_jpeg or to_jpeg) and im.mode not in ('RGB', 'L'):
+            im = im.convert('RGB')
+        # Resize if larger than 1600x1600 preserving aspect ratio
+        im.thumbnail(MAX_UPLOAD_DIMENSIONS, Image.LANCZOS)
+        out_path = root + '.jpg' if to_jpeg else file_path
+        tmp_path = out_path + '.tmp'
+        if is_jpeg or to_jpeg:
+            im.save(tmp_path, format='JPEG', quality=80, optimize=True, progressive=True)
+        elif is_png:
+            im.save(tmp_path, format='PNG', optimize=True)
+        else:
+            im.save(tmp_path, format=im_format or None)
+    if BLOB_NAME.match(os.path.basename(file_path)):
+        out_path = os.path.join(os.path.dirname(file_path),
+                                _file_sha256(tmp_path) + os.path.splitext(out_path)[1])
+    os.replace(tmp_path, out_path)
+    # A renamed original is removed once the record points at out_path
+    return out_path
+
+def process_image(file_path, file_type):
+    """Worker-process entry point: optimize an upload and build its variants
+
+    Returns {'filename': final basename, 'thumbnail': name or None,
+    'variants': [...], 'seconds': elapsed}.
+    """
+    start = time.perf_counter()
+    final_path = file_path
+    thumbnail = None
+    variants = []
+    # A duplicate job may find the file already renamed by the first one
+    if Image is not None and os.path.exists(file_path):
+        if file_type in ('post', 'comment'):
+            try:
+                final_path = _optimize_upload(file_path)
+            except Exception:
+                # If optimization fails, keep original file
+                final_path = file_path
+            try:
+                thumbnail = generate_thumbnail(final_path)
+            except Exception:
+                # Lists fall back to the full image
+                thumbnail = None
+        elif file_type == 'trek':
+            # Responsive WebP/AVIF copies for explore/detail pages
+            try:
+                variants = generate_image_variants(file_path)
+            except Exception:
+                # Pages fall back to the original image
+                variants = []
+    return {
+        'filename': os.path.basename(final_path),
+        'thumbnail': thumbnail,
+        'variants': variants,
+        'seconds': time.perf_counter() - start,
     }
-    
-    # Return the mapped filename or a default image
-    return image_mapping.get(trek_name, 'img1.png')
+
+_image_pool = None
+_image_pool_pid = None
+_image_pool_lock = threading.Lock()
+
+def _get_image_pool():
+    """Per-process worker pool (gunicorn forks workers after import, so track the pid)"""
+    global _image_pool, _image_pool_pid
+    if IMAGE_WORKERS <= 0:
+        return None
+    with _image_pool_lock:
+        if _image_pool is None or _image_pool_pid != os.getpid():
+            _image_pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+            _image_pool_pid = os.getpid()
+        return _image_pool
+
+def _remove_file_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def _repoint_image_references(old, new):
+    """Point every row using image `old` at `new` (call inside the transaction)
+
+    Trek pages are revalidated by ETag, so the versions they are built from
+    (Trek.updated_at, and the rating aggregates' updated_at for comment images)
+    move in the same transaction; otherwise a 304 would keep a page that links
+    the old file after it is deleted.
+    """
+    now = datetime.utcnow()
+    commented_treks = select(TrekComment.trek_id).where(TrekComment.image_filename == old).distinct()
+    (TrekRatingStats.query.filter(TrekRatingStats.trek_id.in_(commented_treks))
+     .update({'updated_at': now}, synchronize_session=False))
+    (Trek.query.filter_by(image_filename=old)
+     .update({'image_filename': new, 'updated_at': now}, synchronize_session=False))
+    for model in (TrekPost, TrekComment):
+        (model.query.filter_by(image_filename=old)
+         .update({'image_filename': new}, synchronize_session=False))
+
+def _image_processed(file_type, filename, result):
+    """Record a finished job and repoint rows at a renamed file (runs in the web process)"""
+    new_filename = result['filename']
+    target = new_filename
+    with app.app_context():
+        try:
+            blob = _find_blob(filename)
+            if blob is not None:
+                if file_type != 'trek':
+                    blob.processed_at = datetime.utcnow()
+                owner = None
+                if new_filename != filename:
+                    owner = (UploadBlob.query
+                             .filter(UploadBlob.filename == new_filename, UploadBlob.id != blob.id)
+                             .first())
+                if owner is not None:
+                    # Another upload already optimized to these exact bytes: fold
+                    # this blob into it so every file has a single owning row
+                    (UploadBlob.query.filter_by(id=owner.id)
+                     .update({'ref_count': UploadBlob.ref_count + blob.ref_count}, synchronize_session=False))
+                    target = owner.url or owner.filename
+                    db.session.delete(blob)
+                else:
+                    blob.filename = new_filename
+            if target != filename:
+                # Every row sharing the blob follows it (re-encoded bytes, PNG photo -> JPEG)
+                _repoint_image_references(filename, target)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Failed to record processed image {filename}: {str(e)}")
+            return
+    if target != filename:
+        # Pages rendered a moment ago may still reference the raw file
+        _remove_when_unreferenced(filename, upload_path(filename, file_type))
+    queue_remote_upload(target)
+
+def queue_image_processing(filename, file_type):
+    """Optimize an uploaded image off the request thread
+
+    Call after committing the row that references `filename`. Blobs that were
+    already processed (duplicate uploads) are skipped.
+    """
+    global _image_pool
+    if not filename or _is_url(filename):
+        return
+    if file_type == 'trek':
+        if _image_variants(filename):
+            queue_remote_upload(filename)
+            return
+    else:
+        blob = _find_blob(filename)
+        if blob is not None and blob.processed_at is not None:
+            queue_remote_upload(filename)
+            return
+    file_path = upload_path(filename, file_type)
+
+    def _done(future):
+        try:
+            result = future.result()
+        except Exception as e:
+            app.logger.error(f"Image processing failed for {filename}: {str(e)}")
+            # Publish the unprocessed original rather than keep it local-only
+            queue_remote_upload(filename)
+            return
+        record_metric(IMAGE_PROCESSING, result['seconds'], file_type=file_type)
+        _image_processed(file_type, filename, result)
+
+    pool = _get_image_pool()
+    if pool is not None:
+        try:
+            pool.submit(process_image, file_path, file_type).add_done_callback(_done)
+            return
+        except Exception as e:
+            # BrokenProcessPool / shutdown: drop the pool and process inline this time
+            app.logger.error(f"Image pool unavailable, processing inline: {str(e)}")
+            _image_pool = None
+    future = Future()
+    try:
+        future.set_result(process_image(file_path, file_type))
+    except Exception as e:
+        future.set_exception(e)
+    _done(future)
+
+# =============================
+# SECTION: Remote Upload Staging
+# - Uploads land on local disk first; a background thread pushes them to the
+#   remote store with retry/backoff, then repoints rows at the remote URL
+# =============================
+REMOTE_UPLOAD_MAX_ATTEMPTS = int(os.getenv('REMOTE_UPLOAD_MAX_ATTEMPTS', 6))
+REMOTE_UPLOAD_RETRY_BASE = float(os.getenv('REMOTE_UPLOAD_RETRY_BASE', 5))  # seconds, doubled per attempt
+# A blob stuck in 'uploading' this long (worker died mid-upload) is retried
+REMOTE_UPLOAD_STALE_AFTER = timedelta(minutes=10)
+REMOTE_FOLDERS = {
+    'trek': 'trekmate/treks',
+    'comment': 'trekmate/comments',
+    'post': 'trekmate/posts'
+}
+
+class CloudinaryStore:
+    """Remote store backed by Cloudinary"""
+
+    def upload(self, path, folder, public_id):
+        with track_external('cloudinary'):
+            upload_res = cloudinary.uploader.upload(
+                path,
+                folder=folder,
+                public_id=public_id,
+                resource_type='image',
+                overwrite=False
+            )
+        url = upload_res.get('secure_url') or upload_res.get('url')
+        if not url:
+            raise RuntimeError('Cloudinary returned no URL')
+        return url
+
+class LocalDirStore:
+    """Stand-in remote store for dev/tests: copies files into a directory
+
+    The directory is expected to be served at `base_url` (any static server),
+    so the whole staging/swap flow can be exercised without Cloudinary.
+    """
+
+    def __init__(self, directory, base_url):
+        self.directory = directory
+        self.base_url = base_url.rstrip('/')
+
+    def upload(self, path, folder, public_id):
+        name = public_id + os.path.splitext(path)[1]
+        dest_dir = os.path.join(self.directory, folder)
+        os.makedirs(dest_dir, exist_ok=True)
+        tmp_path = os.path.join(dest_dir, '.' + name + '.tmp')
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, os.path.join(dest_dir, name))
+        return f"{self.base_url}/{folder}/{name}"
+
+REMOTE_STORE_DIR = os.getenv('REMOTE_STORE_DIR')
+REMOTE_STORE_URL = os.getenv('REMOTE_STORE_URL')
+if CLOUDINARY_ENABLED:
+    remote_store = CloudinaryStore()
+elif REMOTE_STORE_DIR and REMOTE_STORE_URL:
+    remote_store = LocalDirStore(REMOTE_STORE_DIR, REMOTE_STORE_URL)
+else:
+    remote_store = None
+
+_remote_queue = queue.Queue()
+_remote_thread = None
+_remote_thread_pid = None
+_remote_thread_lock = threading.Lock()
+
+def _ensure_remote_uploader():
+    """Start this process's uploader thread (threads don't survive a fork)"""
+    global _remote_thread, _remote_thread_pid
+    with _remote_thread_lock:
+        if _remote_thread is None or _remote_thread_pid != os.getpid() or not _remote_thread.is_alive():
+            _remote_thread = threading.Thread(target=_remote_upload_loop, name='remote-uploader', daemon=True)
+            _remote_thread.start()
+            _remote_thread_pid = os.getpid()
+
+def _remote_upload_loop():
+    while True:
+        blob_id = _remote_queue.get()
+        try:
+            _push_blob(blob_id)
+        except Exception as e:
+            app.logger.error(f"Remote upload of blob {blob_id} failed: {str(e)}")
+        finally:
+            _remote_queue.task_done()
+
+def _enqueue_remote_upload(blob_id, delay=0):
+    _ensure_remote_uploader()
+    if delay:
+        timer = threading.Timer(delay, _remote_queue.put, [blob_id])
+        timer.daemon = True
+        timer.start()
+    else:
+        _remote_queue.put(blob_id)
+
+def queue_remote_upload(filename):
+    """Push a staged blob to the remote store in the background
+
+    Called once image processing is done, so the optimized file is uploaded.
+    A no-op without a remote store, for URLs and for blobs already pushed.
+    """
+    if remote_store is None or not filename or _is_url(filename):
+        return
+    with app.app_context():
+        blob = _find_blob(filename)
+        if blob is None or blob.remote_status != 'pending':
+            return
+        blob_id = blob.id
+    _enqueue_remote_upload(blob_id)
+
+def _push_blob(blob_id):
+    """Upload one blob and swap every reference to its remote URL"""
+    if not REMOTE_STORE_BREAKER.allow():
+        # Remote store is down: wait it out without spending an attempt
+        _enqueue_remote_upload(blob_id, REMOTE_STORE_BREAKER.retry_in() + 1)
+        return
+    with app.app_context():
+        now = datetime.utcnow()
+        # Claim the blob so other workers (and startup resumes) skip it
+        claimed = (UploadBlob.query
+                   .filter(UploadBlob.id == blob_id,
+                           or_(UploadBlob.remote_status == 'pending',
+                               (UploadBlob.remote_status == 'uploading')
+                               & (UploadBlob.remote_attempted_at < now - REMOTE_UPLOAD_STALE_AFTER)))
+                   .update({'remote_status': 'uploading',
+                            'remote_attempts': UploadBlob.remote_attempts + 1,
+                            'remote_attempted_at': now},
+                           synchronize_session=False))
+        db.session.commit()
+        if not claimed:
+            REMOTE_STORE_BREAKER.abandon()
+            return
+        blob = db.session.get(UploadBlob, blob_id)
+        filename = blob.filename
+        try:
+            url = remote_store.upload(os.path.join(BLOB_FOLDER, filename),
+                                      REMOTE_FOLDERS.get(blob.kind, 'trekmate/uploads'), blob.digest)
+            REMOTE_STORE_BREAKER.record(True)
+        except Exception as e:
+            REMOTE_STORE_BREAKER.record(False)
+            attempts = blob.remote_attempts
+            retry = attempts < REMOTE_UPLOAD_MAX_ATTEMPTS
+            if retry:
+                blob.remote_status = 'pending'
+                delay = REMOTE_UPLOAD_RETRY_BASE * 2 ** (attempts - 1)
+                app.logger.warning(f"Remote upload of {filename} failed (attempt {attempts}), retrying in {delay:.0f}s: {str(e)}")
+            else:
+                # Keep serving the local copy; resume_remote_uploads() won't retry it
+                blob.remote_status = 'failed'
+                app.logger.error(f"Giving up remote upload of {filename} after {attempts} attempts: {str(e)}")
+            db.session.commit()
+            if retry:
+                _enqueue_remote_upload(blob_id, delay)
+            return
+        blob.url = url
+        blob.remote_status = 'done'
+        _repoint_image_references(filename, url)
+        db.session.commit()
+    _remove_when_unreferenced(filename, os.path.join(BLOB_FOLDER, filename))
+
+def _remove_when_unreferenced(filename, path, delay=60):
+    """Delete a superseded local file once no row can still point at it
+
+    Waits `delay` seconds for in-flight pages, then re-checks: a row created
+    from a duplicate upload while the blob was being swapped keeps the file.
+    """
+    def _remove():
+        with app.app_context():
+            try:
+                in_use = any(model.query.filter_by(image_filename=filename).first() is not None
+                             for model in (TrekPost, TrekComment, Trek))
+            except Exception:
+                return
+        if not in_use:
+            _remove_file_quietly(path)
+
+    timer = threading.Timer(delay, _remove)
+    timer.daemon = True
+    timer.start()
+
+def resume_remote_uploads():
+    """Re-enqueue blobs left staged by a restart (called once per process)"""
+    if remote_store is None:
+        return
+    cutoff = datetime.utcnow() - REMOTE_UPLOAD_STALE_AFTER
+    pending = (db.session.query(UploadBlob.id)
+               .filter(or_(UploadBlob.remote_status == 'pending',
+                           (UploadBlob.remote_status == 'uploading')
+                           & (UploadBlob.remote_attempted_at < cutoff)))
+               .all())
+    for (blob_id,) in pending:
+        _enqueue_remote_upload(blob_id)
 
 def get_weather_data(city_name, region_name=None):
     """Fetch weather data from OpenWeatherMap API with smart fallbacks"""
@@ -303,6 +1106,9 @@ def get_weather_data(city_name, region_name=None):
         
         # Try each location until we get a successful response
         for location in locations_to_try:
+            if not WEATHER_BREAKER.allow():
+                # API down or key rejected: serve the fallback without waiting on timeouts
+                break
             try:
                 query = f"{location},Maharashtra,IN" if region_name and 'Maharashtra' in region_name else f"{location},IN"
                 
@@ -312,7 +1118,10 @@ def get_weather_data(city_name, region_name=None):
                     'units': 'metric'
                 }
                 
-                response = requests.get(OPENWEATHER_BASE_URL, params=params, timeout=5)
+                with track_external('openweathermap', WEATHER_BREAKER) as call:
+                    response = requests.get(OPENWEATHER_BASE_URL, params=params, timeout=5)
+                    # 404 = unknown location, answered fine; the next candidate is tried
+                    call.failed = response.status_code not in (200, 404)
                 
                 if response.status_code == 200:
                     data = response.json()
@@ -351,6 +1160,170 @@ def get_weather_data(city_name, region_name=None):
             'location': city_name or 'Trek Location'
         }
 
+# =============================
+# SECTION: Metrics
+# - Prometheus counters/histograms (no-ops without prometheus_client)
+# - Outbound call tracking, circuit breakers and DB pool checkout timing
+# =============================
+# Shared secret for /metrics (Authorization: Bearer <token>); open if unset
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+if prometheus_client is not None:
+    REQUEST_LATENCY = prometheus_client.Histogram(
+        'trekmate_request_duration_seconds', 'Request latency by Flask endpoint',
+        ['endpoint', 'method'])
+    REQUEST_COUNT = prometheus_client.Counter(
+        'trekmate_requests_total', 'Requests by Flask endpoint and status',
+        ['endpoint', 'method', 'status'])
+    EXTERNAL_CALLS = prometheus_client.Counter(
+        'trekmate_external_calls_total', 'Outbound calls by service and outcome',
+        ['service', 'outcome'])
+    EXTERNAL_LATENCY = prometheus_client.Histogram(
+        'trekmate_external_call_duration_seconds', 'Outbound call latency by service',
+        ['service'])
+    DB_POOL_WAIT = prometheus_client.Histogram(
+        'trekmate_db_pool_checkout_seconds', 'Time spent getting a connection from the DB pool',
+        buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30))
+    IMAGE_PROCESSING = prometheus_client.Histogram(
+        'trekmate_image_processing_seconds', 'Background image processing time by upload type',
+        ['file_type'], buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+else:
+    REQUEST_LATENCY = REQUEST_COUNT = EXTERNAL_CALLS = EXTERNAL_LATENCY = None
+    DB_POOL_WAIT = IMAGE_PROCESSING = None
+
+def record_metric(metric, value=None, **labels):
+    """Observe `value` on a histogram, or increment a counter when no value is given"""
+    if metric is None:
+        return
+    if labels:
+        metric = metric.labels(**labels)
+    if value is None:
+        metric.inc()
+    else:
+        metric.observe(value)
+
+class CircuitBreaker:
+    """Stop calling a dependency for a while after repeated consecutive failures
+
+    closed: calls go through. open: `threshold` failures in a row, callers
+    should skip the call (and use their fallback) for `reset_after` seconds.
+    half_open: the wait is over; a single trial call is let through and its
+    result closes or re-opens the breaker, everyone else keeps skipping until
+    then. A trial whose result never comes back is given up after
+    `reset_after`. State is per worker process.
+    """
+
+    def __init__(self, name, threshold=5, reset_after=30):
+        self.name = name
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self.trial_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_after:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        """Whether to make the call; call record() (or abandon()) afterwards"""
+        state = self.state
+        if state != 'half_open':
+            return state == 'closed'
+        with self._lock:
+            now = time.monotonic()
+            if self.trial_started is not None and now - self.trial_started < self.reset_after:
+                return False
+            self.trial_started = now
+            return True
+
+    def abandon(self):
+        """The allowed call wasn't made after all: free the half-open trial"""
+        with self._lock:
+            self.trial_started = None
+
+    def retry_in(self):
+        """Seconds until an open breaker lets calls through again"""
+        if self.opened_at is None:
+            return 0
+        return max(0.0, self.reset_after - (time.monotonic() - self.opened_at))
+
+    def record(self, success):
+        with self._lock:
+            self.trial_started = None
+            if success:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.threshold:
+                # Trips, or a half-open trial failed: wait another full period
+                if self.opened_at is None:
+                    app.logger.warning(f"Circuit breaker '{self.name}' opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+
+    def snapshot(self):
+        return {'state': self.state, 'failures': self.failures, 'retry_in': round(self.retry_in(), 1)}
+
+WEATHER_BREAKER = CircuitBreaker('openweathermap')
+SENDGRID_BREAKER = CircuitBreaker('sendgrid')
+REMOTE_STORE_BREAKER = CircuitBreaker('remote_store', reset_after=60)
+CIRCUIT_BREAKERS = (WEATHER_BREAKER, SENDGRID_BREAKER, REMOTE_STORE_BREAKER)
+
+@contextmanager
+def track_external(service, breaker=None):
+    """Count and time an outbound call; set `call.failed = True` for error responses
+
+    With a breaker, the outcome also feeds it (callers check breaker.allow()
+    before making the call).
+    """
+    call = types.SimpleNamespace(failed=False)
+    start = time.perf_counter()
+    try:
+        yield call
+    except Exception:
+        call.failed = True
+        raise
+    finally:
+        record_metric(EXTERNAL_LATENCY, time.perf_counter() - start, service=service)
+        record_metric(EXTERNAL_CALLS, service=service, outcome='failure' if call.failed else 'success')
+        if breaker is not None:
+            breaker.record(not call.failed)
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waits for a connection"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            record_metric(DB_POOL_WAIT, time.perf_counter() - start)
+
+def _default_pool_class(url):
+    """Pool class SQLAlchemy picks for a database URL (None if it can't tell)"""
+    try:
+        url = make_url(url)
+        return url.get_dialect().get_pool_class(url)
+    except Exception:
+        return None
+
+# Only swap in the timed subclass where a QueuePool would be used anyway; a
+# configured pool, or a dialect default such as SQLite :memory:'s
+# SingletonThreadPool, is kept, without the QueuePool-only sizing options
+_engine_options = app.config['SQLALCHEMY_ENGINE_OPTIONS']
+_pool_class = _engine_options.get('poolclass') or _default_pool_class(db_url)
+if _pool_class is QueuePool:
+    _engine_options['poolclass'] = TimedQueuePool
+elif not (isinstance(_pool_class, type) and issubclass(_pool_class, QueuePool)):
+    _engine_options.pop('pool_size', None)
+    _engine_options.pop('max_overflow', None)
+
 # Initialize extensions (preserved order)
 db = SQLAlchemy(app)
 csrf = CSRFProtect(app)
@@ -376,6 +1349,10 @@ def _ensure_db_initialized():
                 create_admin_user()
             except Exception:
                 pass
+            try:
+                resume_remote_uploads()
+            except Exception as e:
+                app.logger.error(f"Could not resume remote uploads: {str(e)}")
             app.config['_DB_INIT_DONE'] = True
         except Exception:
             # Avoid blocking requests if init fails; errors will surface on DB ops
@@ -383,6 +1360,9 @@ def _ensure_db_initialized():
 
 # Make trek image function available in templates
 app.jinja_env.globals['get_trek_image_filename'] = get_trek_image_filename
+app.jinja_env.globals['trek_picture'] = trek_picture
+app.jinja_env.globals['upload_url'] = upload_url
+app.jinja_env.globals['upload_thumb_url'] = upload_thumb_url
 
 # Jinja test: check if a string is an absolute URL (for Cloudinary images)
 def _is_url(value):
@@ -440,6 +1420,7 @@ class Trek(db.Model):
     region_id = db.Column(db.Integer, db.ForeignKey('trek_regions.id'))
     image_filename = db.Column(db.String(255))  # Image filename for trek
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # Bumped on any edit (used for ETags)
     
     # Relationships
     private_routes = db.relationship('PrivateRoute', backref='trek', lazy=True, cascade='all, delete-orphan')
@@ -490,6 +1471,34 @@ class TrekComment(db.Model):
     trek = db.relationship('Trek', backref='comments')
     user = db.relationship('User', backref='comments')
 
+    # Keyset pagination of a trek's reviews (newest first)
+    __table_args__ = (db.Index('ix_trek_comments_trek_created', 'trek_id', 'created_at', 'id'),)
+
+# Per-trek review aggregates, kept in step by add_comment/delete_comment
+class TrekRatingStats(db.Model):
+    __tablename__ = 'trek_rating_stats'
+    trek_id = db.Column(db.Integer, db.ForeignKey('treks.id'), primary_key=True)
+    comment_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_count = db.Column(db.Integer, nullable=False, default=0)  # Comments with a 1-5 rating
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    rating_1 = db.Column(db.Integer, nullable=False, default=0)  # Histogram: comments per star value
+    rating_2 = db.Column(db.Integer, nullable=False, default=0)
+    rating_3 = db.Column(db.Integer, nullable=False, default=0)
+    rating_4 = db.Column(db.Integer, nullable=False, default=0)
+    rating_5 = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)  # Bumped on every change (used for ETags)
+
+    trek = db.relationship('Trek', backref=db.backref('rating_stats', uselist=False))
+
+    @property
+    def average(self):
+        return round(self.rating_sum / self.rating_count, 1) if self.rating_count else None
+
+    @property
+    def histogram(self):
+        """Comment counts for 1..5 stars"""
+        return tuple(getattr(self, f'rating_{stars}') for stars in RATING_VALUES)
+
 # Admin Notification Model
 class AdminNotification(db.Model):
     __tablename__ = 'admin_notifications'
@@ -578,6 +1587,364 @@ class UserNotification(db.Model):
     post = db.relationship('TrekPost')
     comment = db.relationship('TrekPostComment')
 
+
+# Content-addressed upload storage: one row per distinct uploaded file
+class UploadBlob(db.Model):
+    __tablename__ = 'upload_blobs'
+    id = db.Column(db.Integer, primary_key=True)
+    digest = db.Column(db.String(64), unique=True, nullable=False)  # SHA-256 of the uploaded bytes
+    filename = db.Column(db.String(255), unique=True, nullable=False)  # Name under static/uploads/blobs
+    url = db.Column(db.String(500), nullable=True)  # Remote (Cloudinary) URL, if hosted there
+    kind = db.Column(db.String(20))  # Upload type of the first reference: trek, comment or post
+    remote_status = db.Column(db.String(20), nullable=True)  # pending, uploading, done, failed (NULL = local only)
+    remote_attempts = db.Column(db.Integer, nullable=False, default=0)
+    remote_attempted_at = db.Column(db.DateTime, nullable=True)
+    size = db.Column(db.Integer)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)  # Rows whose image_filename points here
+    processed_at = db.Column(db.DateTime, nullable=True)  # Set once resize/re-encode has run
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Blob files are deleted only once the transaction that released them commits
+@event.listens_for(db.session, 'after_commit')
+def _purge_released_files(session):
+    pending = session.info.pop('pending_file_removals', [])
+    for digest, path in pending:
+        # Same bytes may have been uploaded again right after the release
+        # (the session can't emit SQL here, so check on a fresh connection)
+        if digest is not None:
+            try:
+                with db.engine.connect() as conn:
+                    table = UploadBlob.__table__
+                    if conn.execute(db.select(table.c.id).where(table.c.digest == digest)).first():
+                        continue
+            except Exception:
+                continue
+        _remove_file_quietly(path)
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_released_files(session):
+    session.info.pop('pending_file_removals', None)
+
+# =============================
+# SECTION: HTTP Caching
+# - Weak ETags + 304 handling for catalog pages
+# - Cache-Control for static files and uploads
+# =============================
+# Pages embed a CSRF token and live weather, so their validators roll over on this window
+PAGE_ETAG_WINDOW = int(os.getenv('PAGE_ETAG_WINDOW', 1800))
+STATIC_CACHE_MAX_AGE = int(os.getenv('STATIC_CACHE_MAX_AGE', 3600))
+UPLOAD_CACHE_MAX_AGE = 365 * 24 * 3600
+
+def page_etag(*parts):
+    """Build an ETag for a rendered page from its content version parts
+
+    The viewer (id + role) and the current time window are mixed in because the
+    same URL renders differently per user and embeds a time-limited CSRF token.
+    """
+    if current_user.is_authenticated:
+        viewer = f"{current_user.id}:{current_user.role}"
+    else:
+        viewer = 'anon'
+    window = int(time.time() // PAGE_ETAG_WINDOW)
+    raw = '|'.join(str(p) for p in parts + (viewer, window))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def cacheable_page(response, etag):
+    """Attach revalidation headers to a per-viewer HTML page"""
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def not_modified(etag):
+    """Return a 304 response if the client already holds this page version, else None"""
+    # Flash messages are shown exactly once, so a page carrying them is never revalidated
+    if session.get('_flashes'):
+        return None
+    if request.if_none_match.contains_weak(etag):
+        return cacheable_page(app.response_class(status=304), etag)
+    return None
+
+@app.after_request
+def _static_cache_headers(response):
+    """Let browsers/CDNs keep static files; content-addressed uploads and built assets never change"""
+    if request.endpoint != 'static' or response.status_code not in (200, 304):
+        return response
+    filename = (request.view_args or {}).get('filename', '')
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    if filename.startswith(('uploads/', 'dist/')):
+        response.cache_control.max_age = UPLOAD_CACHE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.max_age = STATIC_CACHE_MAX_AGE
+    return response
+
+# Fingerprinted assets built by build_static.py (absent in a plain checkout)
+STATIC_MANIFEST = {}
+_manifest_path = os.path.join(basedir, 'static', 'dist', 'manifest.json')
+if os.getenv('STATIC_MANIFEST', 'true').lower() == 'true' and os.path.exists(_manifest_path):
+    try:
+        with open(_manifest_path, encoding='utf-8') as f:
+            STATIC_MANIFEST = {name: f"dist/{hashed}" for name, hashed in json.load(f).items()}
+    except Exception:
+        STATIC_MANIFEST = {}
+
+@app.url_defaults
+def _fingerprinted_static_url(endpoint, values):
+    """Make url_for('static', filename=...) emit the content-hashed asset name"""
+    if endpoint == 'static' and STATIC_MANIFEST:
+        hashed = STATIC_MANIFEST.get(values.get('filename'))
+        if hashed:
+            values['filename'] = hashed
+
+def _send_static(filename):
+    """Static view that serves .br/.gz siblings of built assets when accepted"""
+    if filename.startswith('dist/') and not filename.endswith(('.gz', '.br')):
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if encoding not in request.accept_encodings:
+                continue
+            encoded = safe_join(app.static_folder, filename + suffix)
+            if encoded and os.path.isfile(encoded):
+                mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                response = send_file(encoded, mimetype=mimetype, conditional=True)
+                response.headers['Content-Encoding'] = encoding
+                response.vary.add('Accept-Encoding')
+                return response
+    response = app.send_static_file(filename)
+    if filename.startswith('dist/'):
+        response.vary.add('Accept-Encoding')
+    return response
+app.view_functions['static'] = _send_static
+
+# =============================
+# SECTION: Request Instrumentation
+# - Per-request SQL query count/time via engine events
+# - Server-Timing header, structured request log, query budget warnings
+# =============================
+SQL_QUERY_BUDGET = int(os.getenv('SQL_QUERY_BUDGET', 25))
+# Log every request (JSON, INFO level); over-budget requests are always logged
+REQUEST_LOG = os.getenv('REQUEST_LOG', 'false').lower() == 'true'
+request_logger = app.logger.getChild('requests')
+request_logger.setLevel(logging.INFO if REQUEST_LOG else logging.WARNING)
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _sql_query_started(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the statement's own context: a statement that raises never
+    # reaches after_cursor_execute, so nothing may outlive it on the connection
+    context._query_start = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _sql_query_finished(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_start
+    # Background threads run in app contexts of their own; only requests are counted
+    if not has_request_context():
+        return
+    g.sql_queries = g.get('sql_queries', 0) + 1
+    g.sql_seconds = g.get('sql_seconds', 0.0) + elapsed
+    # Identical statements repeated within one request are the N+1 signature
+    statements = g.setdefault('sql_statements', {})
+    statements[statement] = statements.get(statement, 0) + 1
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _report_request_timing(response):
+    started = g.get('request_started')
+    if started is None:
+        return response
+    total_ms = (time.perf_counter() - started) * 1000
+    queries = g.get('sql_queries', 0)
+    db_ms = g.get('sql_seconds', 0.0) * 1000
+    response.headers.add('Server-Timing', f'db;dur={db_ms:.1f};desc="{queries} queries"')
+    response.headers.add('Server-Timing', f'app;dur={total_ms:.1f}')
+    endpoint = request.endpoint or 'unmatched'
+    record_metric(REQUEST_LATENCY, total_ms / 1000, endpoint=endpoint, method=request.method)
+    record_metric(REQUEST_COUNT, endpoint=endpoint, method=request.method, status=response.status_code)
+
+    over_budget = queries > SQL_QUERY_BUDGET
+    if over_budget or REQUEST_LOG:
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'duration_ms': round(total_ms, 1),
+            'db_queries': queries,
+            'db_ms': round(db_ms, 1),
+        }
+        if over_budget:
+            record['query_budget'] = SQL_QUERY_BUDGET
+            repeated = sorted(g.get('sql_statements', {}).items(), key=lambda item: -item[1])[:3]
+            record['top_statements'] = [{'count': count, 'sql': ' '.join(sql.split())[:200]}
+                                        for sql, count in repeated]
+            request_logger.warning(json.dumps(record))
+        else:
+            request_logger.info(json.dumps(record))
+    return response
+
+# =============================
+# SECTION: Request Profiler
+# - Sampling profiler for a fraction of requests (admin toggle) or for
+#   requests carrying a signed X-Profile header
+# - Folded stacks per endpoint under PROFILE_DIR (flamegraph.pl / speedscope)
+# =============================
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(basedir, 'profiles'))
+PROFILE_SETTINGS_FILE = os.path.join(PROFILE_DIR, 'settings.json')
+PROFILE_INTERVAL = 0.005  # seconds between stack samples
+PROFILE_MAX_DEPTH = 100
+PROFILE_TOKEN_MAX_AGE = 3600
+PROFILE_SETTINGS_TTL = 2  # seconds a worker trusts its cached copy of the toggle
+
+_profile_settings = {'enabled': False, 'sample_rate': 0.0}
+_profile_settings_mtime = None
+_profile_settings_checked = 0.0
+
+def profiler_settings():
+    """Admin toggle, shared by all workers through a small JSON file"""
+    global _profile_settings, _profile_settings_mtime, _profile_settings_checked
+    now = time.monotonic()
+    if now - _profile_settings_checked < PROFILE_SETTINGS_TTL:
+        return _profile_settings
+    _profile_settings_checked = now
+    try:
+        mtime = os.stat(PROFILE_SETTINGS_FILE).st_mtime
+    except OSError:
+        _profile_settings = {'enabled': False, 'sample_rate': 0.0}
+        _profile_settings_mtime = None
+        return _profile_settings
+    if mtime != _profile_settings_mtime:
+        try:
+            with open(PROFILE_SETTINGS_FILE, 'r', encoding='utf-8') as f:
+                loaded = json.load(f)
+            _profile_settings = {
+                'enabled': bool(loaded.get('enabled')),
+                'sample_rate': min(1.0, max(0.0, float(loaded.get('sample_rate', 0)))),
+            }
+            _profile_settings_mtime = mtime
+        except (OSError, ValueError):
+            pass
+    return _profile_settings
+
+def save_profiler_settings(enabled, sample_rate):
+    global _profile_settings_checked
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    tmp_path = PROFILE_SETTINGS_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'enabled': enabled, 'sample_rate': sample_rate}, f)
+    os.replace(tmp_path, PROFILE_SETTINGS_FILE)
+    _profile_settings_checked = 0.0
+
+def _profile_serializer():
+    return URLSafeTimedSerializer(app.secret_key, salt='request-profiler')
+
+def profile_token(user_id):
+    """Signed X-Profile header value that profiles every request carrying it"""
+    return _profile_serializer().dumps({'by': user_id})
+
+def _profile_token_valid(token):
+    try:
+        _profile_serializer().loads(token, max_age=PROFILE_TOKEN_MAX_AGE)
+        return True
+    except BadSignature:
+        return False
+
+# Sampled threads (ident -> {folded stack: samples}); the sampler thread
+# sleeps on the event while nothing is being profiled
+_profile_targets = {}
+_profile_lock = threading.Lock()
+_profile_wakeup = threading.Event()
+_profile_thread = None
+_profile_thread_pid = None
+
+def _fold_stack(frame):
+    """'file:function;file:function;...' from the outermost frame inwards"""
+    names = []
+    while frame is not None and len(names) < PROFILE_MAX_DEPTH:
+        code = frame.f_code
+        # Jinja template frames show up under their .html file
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}".replace(';', ':').replace(' ', '_'))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+def _sampler_loop():
+    while True:
+        _profile_wakeup.wait()
+        with _profile_lock:
+            targets = list(_profile_targets.items())
+            if not targets:
+                _profile_wakeup.clear()
+                continue
+        frames = sys._current_frames()
+        for ident, stacks in targets:
+            frame = frames.get(ident)
+            if frame is not None:
+                stack = _fold_stack(frame)
+                stacks[stack] = stacks.get(stack, 0) + 1
+        del frames
+        time.sleep(PROFILE_INTERVAL)
+
+def _ensure_sampler():
+    global _profile_thread, _profile_thread_pid
+    with _profile_lock:
+        if _profile_thread is None or _profile_thread_pid != os.getpid() or not _profile_thread.is_alive():
+            _profile_thread = threading.Thread(target=_sampler_loop, name='request-profiler', daemon=True)
+            _profile_thread.start()
+            _profile_thread_pid = os.getpid()
+
+@app.before_request
+def _maybe_profile_request():
+    token = request.headers.get('X-Profile')
+    if token:
+        selected = _profile_token_valid(token)
+    else:
+        settings = profiler_settings()
+        selected = settings['enabled'] and random.random() < settings['sample_rate']
+    if not selected:
+        return
+    _ensure_sampler()
+    g.profile_stacks = {}
+    with _profile_lock:
+        _profile_targets[threading.get_ident()] = g.profile_stacks
+    _profile_wakeup.set()
+
+@app.teardown_request
+def _finish_request_profile(exc):
+    stacks = g.pop('profile_stacks', None)
+    if stacks is None:
+        return
+    with _profile_lock:
+        _profile_targets.pop(threading.get_ident(), None)
+    if not stacks:
+        return
+    endpoint = re.sub(r'[^A-Za-z0-9_.-]', '_', request.endpoint or 'unmatched')
+    lines = ''.join(f"{stack} {count}\n" for stack, count in stacks.items())
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        # One append per request; flamegraph tools sum repeated stacks
+        with open(os.path.join(PROFILE_DIR, endpoint + '.folded'), 'a', encoding='utf-8') as f:
+            f.write(lines)
+    except OSError as e:
+        app.logger.error(f"Could not write profile for {endpoint}: {str(e)}")
+
+def profile_files():
+    """(name, samples, bytes) for every collected .folded file"""
+    files = []
+    try:
+        entries = sorted(os.scandir(PROFILE_DIR), key=lambda entry: entry.name)
+    except FileNotFoundError:
+        return files
+    for entry in entries:
+        if not entry.name.endswith('.folded'):
+            continue
+        samples = 0
+        with open(entry.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                samples += int(line.rsplit(' ', 1)[1])
+        files.append((entry.name, samples, entry.stat().st_size))
+    return files
+
 # =============================
 # SECTION: Auth
 # - #1 Login
@@ -629,6 +1996,9 @@ def _send_via_sendgrid(to_email, subject, body, html_body=None, disable_tracking
     try:
         if not (SENDGRID_API_KEY and SENDGRID_FROM and to_email):
             return False
+        if not SENDGRID_BREAKER.allow():
+            # Go straight to the SMTP fallback
+            return False
         headers = {
             'Authorization': f'Bearer {SENDGRID_API_KEY}',
             'Content-Type': 'application/json'
@@ -651,7 +2021,9 @@ def _send_via_sendgrid(to_email, subject, body, html_body=None, disable_tracking
                 'click_tracking': {'enable': False, 'enable_text': False},
                 'open_tracking': {'enable': False}
             }
-        resp = requests.post('https://api.sendgrid.com/v3/mail/send', headers=headers, json=payload, timeout=10)
+        with track_external('sendgrid', SENDGRID_BREAKER) as call:
+            resp = requests.post(SENDGRID_API_URL, headers=headers, json=payload, timeout=10)
+            call.failed = resp.status_code not in (200, 202)
         if resp.status_code in (200, 202):
             return True
         app.logger.error(f"SendGrid error {resp.status_code}: {resp.text}")
@@ -687,7 +2059,8 @@ If you did not request a password reset, please ignore this email.
     try:
         msg = Message(subject, recipients=[email])
         msg.body = body
-        mail.send(msg)
+        with track_external('smtp'):
+            mail.send(msg)
         return True
     except Exception as e:
         app.logger.error(f"Failed to send email (fallback): {str(e)}")
@@ -709,7 +2082,8 @@ def send_user_email(to_email, subject, body):
             return False
         msg = Message(subject, recipients=[to_email])
         msg.body = body
-        mail.send(msg)
+        with track_external('smtp'):
+            mail.send(msg)
         return True
     except Exception as e:
         app.logger.error(f"Failed to send user email (fallback): {str(e)}")
@@ -991,9 +2365,58 @@ def create_notification(recipient_id, notif_type, message, post_id=None, comment
     except Exception:
         db.session.rollback()
 
+# id -> (expires at, column values). Saves the per-request users lookup; rows
+# changed through the ORM are dropped at flush and again at commit, while edits
+# made by other processes or raw SQL show up once the entry expires.
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 60))
+USER_CACHE_SIZE = 10000
+_user_cache = {}
+_user_cache_lock = threading.Lock()
+
+def invalidate_cached_user(user_id):
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, target):
+    invalidate_cached_user(target.id)
+    # A concurrent request may re-cache the old row before this transaction commits
+    db.session.info.setdefault('stale_user_ids', set()).add(target.id)
+
+@event.listens_for(db.session, 'after_commit')
+def _drop_stale_users(session):
+    for user_id in session.info.pop('stale_user_ids', ()):
+        invalidate_cached_user(user_id)
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_stale_users(session):
+    session.info.pop('stale_user_ids', None)
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    if USER_CACHE_TTL <= 0:
+        return db.session.get(User, user_id)
+    now = time.monotonic()
+    cached = _user_cache.get(user_id)
+    if cached and cached[0] > now:
+        # Attach as if loaded from the database: no SELECT, and later lookups in
+        # this request get the same object from the identity map
+        user = User(**cached[1])
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+    user = db.session.get(User, user_id)
+    if user is None:
+        invalidate_cached_user(user_id)
+        return None
+    values = {column.key: getattr(user, column.key) for column in User.__mapper__.column_attrs}
+    with _user_cache_lock:
+        if len(_user_cache) >= USER_CACHE_SIZE:
+            for key in [key for key, (expires, _) in _user_cache.items() if expires <= now] or list(_user_cache):
+                del _user_cache[key]
+        _user_cache[user_id] = (now + USER_CACHE_TTL, values)
+    return user
 
 @app.route('/')
 def home():
@@ -1005,6 +2428,87 @@ def home():
 def health():
     return 'ok', 200
 
+# Readiness for the load balancer: is this worker able to serve DB-backed pages?
+READY_DB_TIMEOUT = float(os.getenv('READY_DB_TIMEOUT', 2))
+_ready_probe_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ready-probe')
+_ready_probe = None
+
+def _probe_database():
+    start = time.perf_counter()
+    with app.app_context():
+        with db.engine.connect() as conn:
+            conn.execute(db.text('SELECT 1'))
+    return time.perf_counter() - start
+
+def pool_status():
+    """Checkout counts of the engine's connection pool"""
+    pool = db.engine.pool
+    if not isinstance(pool, QueuePool):
+        return {'class': type(pool).__name__}
+    # The configured value (QueuePool keeps it private); -1 means no limit
+    max_overflow = app.config['SQLALCHEMY_ENGINE_OPTIONS'].get('max_overflow', 10)
+    capacity = pool.size() + max_overflow if max_overflow >= 0 else 0
+    checked_out = pool.checkedout()
+    return {
+        'size': pool.size(),
+        'max_overflow': max_overflow,
+        'checked_out': checked_out,
+        'utilization': round(checked_out / capacity, 2) if capacity > 0 else 0,
+        'saturated': capacity > 0 and checked_out >= capacity,
+    }
+
+@app.route('/ready')
+def ready():
+    """Readiness probe: 503 when the DB is unreachable or the pool is exhausted
+
+    Returns quickly either way (the DB check runs on a helper thread with a
+    short timeout) so saturated workers shed traffic instead of queueing it.
+    Open circuit breakers are reported but don't fail readiness: every
+    instance shares the same dependencies and pages have fallbacks.
+    """
+    global _ready_probe
+    pool = pool_status()
+    db_check = {'ok': False}
+    if pool.get('saturated'):
+        db_check['error'] = 'connection pool exhausted'
+    elif _ready_probe is not None and not _ready_probe.done():
+        # The previous probe is still stuck waiting on the DB
+        db_check['error'] = 'previous probe still pending'
+    else:
+        _ready_probe = _ready_probe_executor.submit(_probe_database)
+        try:
+            db_check['latency_ms'] = round(_ready_probe.result(timeout=READY_DB_TIMEOUT) * 1000, 1)
+            db_check['ok'] = True
+        except FutureTimeoutError:
+            db_check['error'] = f'no connection within {READY_DB_TIMEOUT:g}s'
+        except Exception as e:
+            db_check['error'] = str(e)
+    body = {
+        'status': 'ready' if db_check['ok'] else 'unavailable',
+        'database': db_check,
+        'pool': pool,
+        'circuit_breakers': {breaker.name: breaker.snapshot() for breaker in CIRCUIT_BREAKERS},
+    }
+    return body, 200 if db_check['ok'] else 503
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint (merged across gunicorn workers in multiprocess mode)"""
+    if prometheus_client is None:
+        return 'prometheus_client not installed', 501
+    if METRICS_TOKEN:
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied, f'Bearer {METRICS_TOKEN}'):
+            return 'Unauthorized', 401
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    response = make_response(prometheus_client.generate_latest(registry))
+    response.headers['Content-Type'] = prometheus_client.CONTENT_TYPE_LATEST
+    return response
+
 # Friendly error for oversized uploads (prevents proxy HTTP2 protocol errors)
 @app.errorhandler(RequestEntityTooLarge)
 def handle_request_entity_too_large(e):
@@ -1054,8 +2558,15 @@ def delete_trek(trek_id):
         # Delete associated saved treks
         SavedTrek.query.filter_by(trek_id=trek_id).delete()
         
-        # Delete associated comments
+        # Delete associated comments (releasing their images)
+        comment_images = db.session.query(TrekComment.image_filename).filter(
+            TrekComment.trek_id == trek_id, TrekComment.image_filename.isnot(None)
+        ).all()
+        for (image_filename,) in comment_images:
+            release_upload(image_filename, 'comment')
         TrekComment.query.filter_by(trek_id=trek_id).delete()
+        TrekRatingStats.query.filter_by(trek_id=trek_id).delete()
+        release_upload(trek.image_filename, 'trek')
         
         # Delete the trek
         db.session.delete(trek)
@@ -1202,6 +2713,7 @@ def trek_management():
                 db.session.add(public_mumbai_route)
                 
             db.session.commit()
+            queue_image_processing(image_filename, 'trek')
             flash('Trek added successfully!', 'success')
             return redirect(url_for('trek_management'))
             
@@ -1265,9 +2777,12 @@ def edit_trek(trek_id):
 
             # Handle optional image upload (keep old if none)
             image = request.files.get('image')
+            image_filename = None
             if image and allowed_file(image.filename):
                 image_filename = save_uploaded_file(image, file_type='trek')
-                trek.image_filename = image_filename or trek.image_filename
+                if image_filename and image_filename != trek.image_filename:
+                    release_upload(trek.image_filename, 'trek')
+                    trek.image_filename = image_filename
 
             # Find or create region
             if region_name:
@@ -1294,6 +2809,8 @@ def edit_trek(trek_id):
             )
             trek.best_season = best_season
             trek.base_village = location
+            # Route-only edits don't touch the trek row, so bump explicitly for ETags
+            trek.updated_at = datetime.utcnow()
 
             # Upsert PrivateRoute - Pune
             pune_private = PrivateRoute.query.filter_by(trek_id=trek.id, from_city="Pune").first()
@@ -1360,6 +2877,7 @@ def edit_trek(trek_id):
                     db.session.delete(mumbai_public)
 
             db.session.commit()
+            queue_image_processing(image_filename, 'trek')
             flash('Trek updated successfully!', 'success')
             return redirect(url_for('trek_management'))
         except Exception as e:
@@ -1408,9 +2926,23 @@ def explore():
     search = (request.args.get('search', '') or '').strip()
     difficulty_filter = request.args.get('difficulty', '')
     region_filter = request.args.get('region', '')
-    
-    # Base query
-    query = Trek.query.outerjoin(TrekRegion)
+
+    # Revalidate against the catalog and rating versions before running the search
+    trek_count, last_update, last_create, last_rating = db.session.query(
+        func.count(Trek.id), func.max(Trek.updated_at), func.max(Trek.created_at),
+        select(func.max(TrekRatingStats.updated_at)).scalar_subquery()
+    ).one()
+    # Saved state for the cards' bookmark buttons (rendered server-side, one query)
+    saved_ids = saved_trek_ids(current_user.id) if current_user.is_authenticated else set()
+    etag = page_etag('explore', trek_count, last_update, last_create, last_rating,
+                     TrekRegion.query.count(), request.query_string.decode('utf-8', 'replace'),
+                     ','.join(map(str, sorted(saved_ids))))
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    # Base query (cards show the average rating)
+    query = Trek.query.outerjoin(TrekRegion).options(joinedload(Trek.rating_stats))
     
     # Apply search filter
     if search:
@@ -1445,9 +2977,172 @@ def explore():
     treks = query.all()
     regions = TrekRegion.query.all()
     
-    return render_template('explore.html', treks=treks, regions=regions, 
+    html = render_template('explore.html', treks=treks, regions=regions, 
                          search=search, difficulty_filter=difficulty_filter,
-                         region_filter=region_filter)
+                         region_filter=region_filter, saved_trek_ids=saved_ids)
+    return cacheable_page(make_response(html), etag)
+
+# =============================
+# SECTION: Trek Rating Aggregates
+# - TrekRatingStats keeps each trek's review count, rating sum and star
+#   histogram, so pages show ratings without scanning comments
+# =============================
+RATING_VALUES = range(1, 6)
+
+def rating_stats_columns():
+    """Aggregates over trek_comments for each TrekRatingStats column"""
+    rated = TrekComment.rating.between(1, 5)
+    return {
+        'comment_count': func.count(TrekComment.id),
+        'rating_count': func.count(case((rated, 1))),
+        'rating_sum': func.coalesce(func.sum(case((rated, TrekComment.rating))), 0),
+        **{f'rating_{stars}': func.count(case((TrekComment.rating == stars, 1))) for stars in RATING_VALUES},
+    }
+
+def rebuild_rating_stats(trek_ids=None):
+    """Recompute TrekRatingStats from the comments (every trek, or only `trek_ids`); returns rows written
+
+    Runs in the caller's transaction: the backfill in update_db.py, after
+    bulk-loading comments, and for a trek's first change without a row.
+    """
+    columns = rating_stats_columns()
+    query = select(TrekComment.trek_id, *columns.values()).group_by(TrekComment.trek_id)
+    stale = delete(TrekRatingStats)
+    if trek_ids is not None:
+        query = query.where(TrekComment.trek_id.in_(trek_ids))
+        stale = stale.where(TrekRatingStats.trek_id.in_(trek_ids))
+    now = datetime.utcnow()
+    rows = [dict(zip(['trek_id', *columns], row), updated_at=now) for row in db.session.execute(query)]
+    db.session.execute(stale)
+    if rows:
+        db.session.execute(insert(TrekRatingStats), rows)
+    return len(rows)
+
+def record_comment_rating(trek_id, rating, delta):
+    """Apply one added (delta=1) or deleted (delta=-1) comment to its trek's aggregates
+
+    Call in the transaction that adds/deletes the comment. The counters are
+    bumped in SQL, so concurrent reviews don't overwrite each other.
+    """
+    values = {'comment_count': TrekRatingStats.comment_count + delta, 'updated_at': datetime.utcnow()}
+    if rating in RATING_VALUES:
+        column = f'rating_{rating}'
+        values.update({
+            'rating_count': TrekRatingStats.rating_count + delta,
+            'rating_sum': TrekRatingStats.rating_sum + delta * rating,
+            column: getattr(TrekRatingStats, column) + delta,
+        })
+    updated = (TrekRatingStats.query.filter_by(trek_id=trek_id)
+               .update(values, synchronize_session=False))
+    if not updated:
+        # No row yet: count the comments, which already include this change
+        db.session.flush()
+        rebuild_rating_stats([trek_id])
+
+# =============================
+# SECTION: Trek Detail Loader
+# - The detail page reads immutable view models built from two queries: the
+#   trek with region/routes/highlights/rating aggregates plus its saved flag,
+#   then one page of comments joined with their authors (only when the page
+#   is actually rendered)
+# =============================
+RegionView = namedtuple('RegionView', 'id name')
+PrivateRouteView = namedtuple('PrivateRouteView', 'id from_city route_description distance_km duration road_condition parking_info')
+PublicRouteView = namedtuple('PublicRouteView', 'id from_city route_steps total_time frequency')
+HighlightView = namedtuple('HighlightView', 'id highlight')
+TrekView = namedtuple('TrekView', 'id name full_name gen_z_intro height_ft height_m distance_km duration '
+                                  'difficulty difficulty_color best_season base_village image_filename '
+                                  'created_at updated_at region private_routes public_routes highlights')
+CommentView = namedtuple('CommentView', 'id user_id comment rating image_filename created_at user')
+RatingSummary = namedtuple('RatingSummary', 'comment_count rating_count average histogram updated_at')
+TrekDetail = namedtuple('TrekDetail', 'trek is_saved ratings')
+NO_RATINGS = RatingSummary(0, 0, None, (0,) * len(RATING_VALUES), None)
+COMMENTS_PAGE_SIZE = 20
+
+class CommentAuthor(namedtuple('CommentAuthor', 'id name role')):
+    __slots__ = ()
+
+    def is_admin(self):
+        return self.role == 'admin'
+
+def _view(view_class, obj, **values):
+    """Build a view model from an ORM object's attributes (`values` override)"""
+    return view_class._make(values[field] if field in values else getattr(obj, field)
+                            for field in view_class._fields)
+
+def _views(view_class, objs):
+    return tuple(_view(view_class, obj) for obj in sorted(objs, key=lambda obj: obj.id))
+
+def rating_summary(stats):
+    """RatingSummary for a TrekRatingStats row (or None)"""
+    if stats is None:
+        return NO_RATINGS
+    return RatingSummary(stats.comment_count, stats.rating_count, stats.average, stats.histogram, stats.updated_at)
+
+def load_trek_detail(trek_id, user_id=None):
+    """TrekDetail for the trek page in one query, or None if the trek doesn't exist
+
+    The three child collections are joined eagerly; they hold a handful of rows
+    each, so the joined result stays small.
+    """
+    if user_id is None:
+        is_saved = literal(False)
+    else:
+        is_saved = (select(SavedTrek.id)
+                    .where(SavedTrek.trek_id == Trek.id, SavedTrek.user_id == user_id)
+                    .exists())
+    row = db.session.execute(
+        select(Trek, is_saved)
+        .options(joinedload(Trek.region), joinedload(Trek.rating_stats), joinedload(Trek.private_routes),
+                 joinedload(Trek.public_routes), joinedload(Trek.highlights))
+        .where(Trek.id == trek_id)
+    ).unique().first()
+    if row is None:
+        return None
+    trek, saved = row
+    view = _view(
+        TrekView, trek,
+        region=_view(RegionView, trek.region) if trek.region else None,
+        private_routes=_views(PrivateRouteView, trek.private_routes),
+        public_routes=_views(PublicRouteView, trek.public_routes),
+        highlights=_views(HighlightView, trek.highlights),
+    )
+    return TrekDetail(view, bool(saved), rating_summary(trek.rating_stats))
+
+def comment_cursor(comment):
+    """Keyset position of a comment for the `before` query parameter"""
+    return f"{comment.created_at.isoformat()}_{comment.id}"
+
+def parse_comment_cursor(value):
+    """(created_at, id) from a `before` parameter, or None if it is missing or malformed"""
+    created_at, _, comment_id = (value or '').rpartition('_')
+    try:
+        return datetime.fromisoformat(created_at), int(comment_id)
+    except ValueError:
+        return None
+
+def load_trek_comments(trek_id, before=None, limit=COMMENTS_PAGE_SIZE):
+    """One page of CommentViews for a trek, newest first, with their authors
+
+    `before` is a (created_at, id) keyset position; the page starts just after
+    it. Returns (comments, cursor of the next page or None).
+    """
+    # The inner join also drops orphaned comments whose user no longer exists
+    query = (select(TrekComment.id, TrekComment.user_id, TrekComment.comment, TrekComment.rating,
+                    TrekComment.image_filename, TrekComment.created_at, User.name, User.role)
+             .join(User, User.id == TrekComment.user_id)
+             .where(TrekComment.trek_id == trek_id)
+             .order_by(TrekComment.created_at.desc(), TrekComment.id.desc())
+             .limit(limit + 1))
+    if before is not None:
+        query = query.where(tuple_(TrekComment.created_at, TrekComment.id) < tuple_(*before))
+    comments = [CommentView(comment_id, user_id, comment, rating, image_filename, created_at,
+                            CommentAuthor(user_id, name, role))
+                for comment_id, user_id, comment, rating, image_filename, created_at, name, role
+                in db.session.execute(query)]
+    if len(comments) > limit:
+        return comments[:limit], comment_cursor(comments[limit - 1])
+    return comments, None
 
 # =============================
 # SECTION: Trek Detail & Trek Comments
@@ -1457,13 +3152,21 @@ def explore():
 @app.route('/trek/<int:trek_id>')
 def trek_detail(trek_id):
     """Trek detail page"""
-    trek = Trek.query.get_or_404(trek_id)
-    # Exclude orphaned comments that reference a non-existent user (can happen after schema changes)
-    comments = (TrekComment.query
-                .join(User)
-                .filter(TrekComment.trek_id == trek_id)
-                .order_by(TrekComment.created_at.desc())
-                .all())
+    detail = load_trek_detail(trek_id, current_user.id if current_user.is_authenticated else None)
+    if detail is None:
+        abort(404)
+    trek, is_saved, ratings = detail
+
+    # Revalidate before fetching comments and weather
+    etag = page_etag('trek', trek.id, trek.updated_at or trek.created_at,
+                     ratings.comment_count, ratings.updated_at, is_saved,
+                     request.query_string.decode('utf-8', 'replace'))
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    before = parse_comment_cursor(request.args.get('before'))
+    comments, next_cursor = load_trek_comments(trek_id, before)
     
     # Get weather data for the trek location
     weather_data = None
@@ -1482,13 +3185,9 @@ def trek_detail(trek_id):
         city = region_cities.get(trek.region.name, 'Mumbai')
         weather_data = get_weather_data(city, trek.region.name)
     
-    # Check if trek is saved by current user
-    is_saved = False
-    if current_user.is_authenticated:
-        saved_trek = SavedTrek.query.filter_by(user_id=current_user.id, trek_id=trek_id).first()
-        is_saved = saved_trek is not None
-    
-    return render_template('trek_detail.html', trek=trek, comments=comments, weather=weather_data, is_saved=is_saved)
+    html = render_template('trek_detail.html', trek=trek, comments=comments, weather=weather_data, is_saved=is_saved,
+                           ratings=ratings, next_cursor=next_cursor, paged=before is not None)
+    return cacheable_page(make_response(html), etag)
 
 @app.route('/trek/<int:trek_id>/comment', methods=['POST'])
 @login_required
@@ -1497,6 +3196,8 @@ def add_comment(trek_id):
     trek = Trek.query.get_or_404(trek_id)
     comment_text = request.form.get('comment')
     rating = request.form.get('rating', type=int)
+    if rating not in RATING_VALUES:
+        rating = None
     
     if not comment_text:
         flash('Comment required!', 'error')
@@ -1521,7 +3222,9 @@ def add_comment(trek_id):
     )
     
     db.session.add(comment)
+    record_comment_rating(trek_id, rating, 1)
     db.session.commit()
+    queue_image_processing(image_filename, 'comment')
     
     # Create admin notification for new comment
     if not current_user.is_admin():  # Don't notify for admin's own comments
@@ -1554,28 +3257,13 @@ def delete_comment(comment_id):
         flash('You do not have permission to delete this comment.', 'error')
         return redirect(url_for('trek_detail', trek_id=trek_id))
     
-    # Delete associated image file if exists
-    if comment.image_filename:
-        # If it's a URL (e.g., Cloudinary), do not try to delete locally
-        try:
-            is_url = isinstance(comment.image_filename, str) and (
-                comment.image_filename.startswith('http://') or comment.image_filename.startswith('https://')
-            )
-        except Exception:
-            is_url = False
-        if not is_url:
-            local_dir = os.path.join(basedir, 'static', 'uploads', 'comments')
-            image_path = os.path.join(local_dir, comment.image_filename)
-            if os.path.exists(image_path):
-                try:
-                    os.remove(image_path)
-                except OSError:
-                    pass  # Ignore file deletion errors
-    
     try:
+        # Release the image; the file is removed after commit if nothing else uses it
+        release_upload(comment.image_filename, 'comment')
         # Delete notifications referencing this comment to avoid FK constraint errors
         AdminNotification.query.filter_by(comment_id=comment.id).delete(synchronize_session=False)
         db.session.delete(comment)
+        record_comment_rating(trek_id, comment.rating, -1)
         db.session.commit()
         flash('Comment deleted successfully.', 'success')
     except Exception:
@@ -1873,6 +3561,7 @@ def trek_feed():
         )
         db.session.add(post)
         db.session.commit()
+        queue_image_processing(image_filename, 'post')
         flash('Post created!', 'success')
         return redirect(url_for('trek_feed'))
 
@@ -1885,8 +3574,8 @@ def trek_feed():
     post_data = []
     reacted_post_ids = set()
     if current_user.is_authenticated:
-        user_reacts = TrekPostReaction.query.filter_by(user_id=current_user.id).all()
-        reacted_post_ids = {r.post_id for r in user_reacts}
+        reacted_post_ids = set(db.session.scalars(
+            select(TrekPostReaction.post_id).where(TrekPostReaction.user_id == current_user.id)))
 
     for p in posts:
         reactions_count = TrekPostReaction.query.filter_by(post_id=p.id).count()
@@ -1979,6 +3668,9 @@ def delete_post(post_id):
         TrekPostComment.query.filter_by(post_id=post_id).filter(TrekPostComment.parent_id.isnot(None)).delete(synchronize_session=False)
         TrekPostComment.query.filter_by(post_id=post_id).filter(TrekPostComment.parent_id.is_(None)).delete(synchronize_session=False)
 
+        # Release the post image (removed after commit once unreferenced)
+        release_upload(post.image_filename, 'post')
+
         # Finally delete the post
         db.session.delete(post)
         db.session.commit()
@@ -2032,6 +3724,43 @@ def admin_notifications():
     
     return render_template('admin_notifications.html', notifications=notifications)
 
+@app.route('/admin/profiler', methods=['GET', 'POST'])
+@login_required
+def admin_profiler():
+    """Turn request sampling on/off and download collected profiles"""
+    if not current_user.is_admin():
+        return redirect(url_for('home'))
+
+    token = None
+    if request.method == 'POST':
+        action = request.form.get('action')
+        if action == 'save':
+            enabled = request.form.get('enabled') == 'on'
+            sample_rate = request.form.get('sample_rate', 0, type=float) / 100
+            save_profiler_settings(enabled, min(1.0, max(0.0, sample_rate)))
+            flash('Profiler settings saved.', 'success')
+        elif action == 'clear':
+            for name, _, _ in profile_files():
+                _remove_file_quietly(os.path.join(PROFILE_DIR, name))
+            flash('Collected profiles cleared.', 'success')
+        elif action == 'token':
+            token = profile_token(current_user.id)
+        if action != 'token':
+            return redirect(url_for('admin_profiler'))
+
+    return render_template('admin_profiler.html', settings=profiler_settings(), files=profile_files(),
+                           token=token, token_hours=PROFILE_TOKEN_MAX_AGE // 3600)
+
+@app.route('/admin/profiler/<name>')
+@login_required
+def download_profile(name):
+    if not current_user.is_admin():
+        return redirect(url_for('home'))
+    path = safe_join(PROFILE_DIR, name)
+    if path is None or not name.endswith('.folded') or not os.path.isfile(path):
+        return 'Not found', 404
+    return send_file(path, mimetype='text/plain', as_attachment=True, download_name=name)
+
 @app.route('/admin/notifications/check')
 @login_required
 def check_notifications():
@@ -2107,8 +3836,20 @@ def mark_all_notifications_read():
 
 # =============================
 # SECTION: Saved Treks
-# - Save/Unsave, check saved, remove by id
+# - Save/Unsave, check saved (single and batch), remove by id
 # =============================
+MAX_SAVED_LOOKUP = 500  # Trek ids per batch is-saved request
+
+def saved_trek_ids(user_id, trek_ids=None):
+    """Ids of the treks a user has saved (only among `trek_ids` if given)
+
+    One query, answered from the (user_id, trek_id) unique index.
+    """
+    query = select(SavedTrek.trek_id).where(SavedTrek.user_id == user_id)
+    if trek_ids is not None:
+        query = query.where(SavedTrek.trek_id.in_(trek_ids))
+    return set(db.session.scalars(query))
+
 @app.route('/trek/<int:trek_id>/save', methods=['POST'])
 @login_required
 def save_trek(trek_id):
@@ -2169,6 +3910,21 @@ def check_trek_saved(trek_id):
     saved_trek = SavedTrek.query.filter_by(user_id=current_user.id, trek_id=trek_id).first()
     return jsonify({'is_saved': saved_trek is not None})
 
+@app.route('/api/treks/saved')
+@login_required
+def check_treks_saved():
+    """Which of the given treks (?ids=1,2,3) the current user has saved"""
+    from flask import jsonify
+
+    try:
+        trek_ids = {int(value) for value in ','.join(request.args.getlist('ids')).split(',') if value.strip()}
+    except ValueError:
+        return jsonify({'error': 'ids must be a comma-separated list of trek ids'}), 400
+    if len(trek_ids) > MAX_SAVED_LOOKUP:
+        return jsonify({'error': f'At most {MAX_SAVED_LOOKUP} trek ids per request'}), 400
+    saved = saved_trek_ids(current_user.id, trek_ids) if trek_ids else set()
+    return jsonify({'saved': sorted(saved)})
+
 @app.route('/saved-trek/<int:saved_trek_id>/remove', methods=['POST'])
 @login_required
 def remove_saved_trek(saved_trek_id):
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Benchmark the main routes against a seeded database
+
+Seeds a local database (SQLite by default, or any DATABASE_URL such as
+Postgres) with the trek catalog plus synthetic users, feed posts, reactions,
+comments and notifications (generate_data.py), starts local fakes for OpenWeatherMap and
+SendGrid, then drives the app in-process and reports throughput and
+p50/p90/p99 latency per route as JSON, along with the mean SQL query count
+taken from the Server-Timing header.
+
+    python benchmark.py                                   # default scale
+    python benchmark.py --users 5000 --posts 100000 --reactions 1000000
+    python benchmark.py --output before.json
+    python benchmark.py --output after.json --compare before.json
+
+The database is reused between runs (pass --reseed after changing the scale).
+Each route stops after --max-seconds of measured requests, so an unpaginated
+page at a large scale doesn't stall the whole run.
+--compare exits with status 1 when a route's p50 or p99 regressed by more
+than --threshold percent.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+DEFAULT_DATABASE = os.path.join(tempfile.gettempdir(), 'trekmate-benchmark.db')
+
+ROUTES = ('explore', 'trek_detail', 'trek_feed', 'trek_match', 'check_notifications')
+
+
+# =============================
+# Local fakes for external APIs
+# =============================
+class FakeApiHandler(BaseHTTPRequestHandler):
+    """OpenWeatherMap (GET) and SendGrid (POST) stand-in"""
+    latency = 0.0
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        body = json.dumps({
+            'name': 'Pune',
+            'main': {'temp': 24.6, 'humidity': 71},
+            'weather': [{'main': 'Clouds', 'description': 'scattered clouds', 'icon': '03d'}],
+            'wind': {'speed': 3.1},
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        time.sleep(self.latency)
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.send_response(202)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_apis(latency_ms):
+    FakeApiHandler.latency = latency_ms / 1000
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeApiHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def configure_environment(args, fake_api_url):
+    """Point the app at the benchmark DB and the fakes (before importing it)"""
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    os.environ['OPENWEATHER_API_KEY'] = 'benchmark'
+    os.environ['OPENWEATHER_BASE_URL'] = fake_api_url + '/data/2.5/weather'
+    os.environ['SENDGRID_API_KEY'] = 'benchmark'
+    os.environ['SENDGRID_FROM'] = 'benchmark@example.com'
+    os.environ['SENDGRID_API_URL'] = fake_api_url + '/v3/mail/send'
+    os.environ['IMAGE_WORKERS'] = '0'
+    # Query counts go into the report; don't log a budget warning per request
+    os.environ['SQL_QUERY_BUDGET'] = str(10 ** 9)
+    for name in ('CLOUDINARY_URL', 'CLOUDINARY_CLOUD_NAME', 'REMOTE_STORE_DIR', 'ADMIN_EMAIL'):
+        os.environ.pop(name, None)
+
+
+# =============================
+# Seeding
+# =============================
+def seed_database(args):
+    """Catalog from trekdata via import_trek_data, synthetic rows via generate_data"""
+    from app import app, db, User
+    import import_trek_data
+    import generate_data
+
+    with app.app_context():
+        if args.reseed:
+            db.drop_all()
+        db.create_all()
+        if User.query.first() is not None:
+            print("Reusing seeded database (pass --reseed to rebuild it)", file=sys.stderr)
+            return
+        start = time.perf_counter()
+        cwd = os.getcwd()
+        os.chdir(basedir)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                import_trek_data.insert_data()
+        finally:
+            os.chdir(cwd)
+        print("Seeding:", file=sys.stderr)
+        generate_data.generate(users=args.users, posts=args.posts, reactions=args.reactions,
+                               post_comments=args.post_comments, trek_comments=args.trek_comments,
+                               seed=args.seed, log=lambda line: print(line, file=sys.stderr))
+        # The lowest id doubles as the admin for /admin/notifications/check
+        admin = User.query.order_by(User.id).first()
+        admin.role = 'admin'
+        db.session.commit()
+        print(f"Seeded in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+
+# =============================
+# Measurement
+# =============================
+def make_client(app, user_id):
+    client = app.test_client()
+    if user_id is not None:
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(user_id)
+            sess['_fresh'] = True
+    return client
+
+
+def route_requests(name, rng, trek_ids):
+    """(method, path, form) for one request to a route"""
+    if name == 'explore':
+        return 'GET', '/explore', None
+    if name == 'trek_detail':
+        return 'GET', f"/trek/{rng.choice(trek_ids)}", None
+    if name == 'trek_feed':
+        return 'GET', '/trek-feed', None
+    if name == 'trek_match':
+        return 'POST', '/trek-match', {
+            'age_group': rng.choice(('18-25', '26-35', '36-50')),
+            'fitness_level': rng.choice(('beginner', 'intermediate', 'advanced')),
+            'experience': rng.choice(('none', 'some', 'experienced')),
+            'trek_type': rng.sample(('fort', 'waterfall', 'forest', 'camping'), 2),
+        }
+    if name == 'check_notifications':
+        return 'GET', '/admin/notifications/check', None
+    raise ValueError(name)
+
+
+SERVER_TIMING_QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+def query_count(response):
+    match = SERVER_TIMING_QUERIES.search(', '.join(response.headers.getlist('Server-Timing')))
+    return int(match.group(1)) if match else 0
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def benchmark_route(app, name, args, trek_ids, user_ids):
+    """Run warmup + measured requests for one route; returns its stats"""
+    admin_id = user_ids[0]
+    viewer_id = admin_id if name == 'check_notifications' else user_ids[len(user_ids) // 2]
+
+    def worker(count, seed, deadline=None):
+        rng = random.Random(seed)
+        client = make_client(app, viewer_id)
+        latencies, queries, errors = [], [], 0
+        for _ in range(count):
+            if deadline and time.perf_counter() > deadline:
+                break
+            method, path, form = route_requests(name, rng, trek_ids)
+            start = time.perf_counter()
+            response = client.open(path, method=method, data=form)
+            latencies.append(time.perf_counter() - start)
+            queries.append(query_count(response))
+            if response.status_code >= 400:
+                errors += 1
+        return latencies, queries, errors
+
+    worker(args.warmup, args.seed)
+    per_worker = max(1, args.requests // args.concurrency)
+    wall_start = time.perf_counter()
+    # Slow routes stop early (at least one request each) instead of stalling the run
+    deadline = wall_start + args.max_seconds if args.max_seconds else None
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(worker, [per_worker] * args.concurrency,
+                                [args.seed + i for i in range(args.concurrency)],
+                                [deadline] * args.concurrency))
+    wall = time.perf_counter() - wall_start
+
+    latencies = sorted(lat for worker_latencies, _, _ in results for lat in worker_latencies)
+    queries = [count for _, worker_queries, _ in results for count in worker_queries]
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors for _, _, errors in results),
+        'db_queries': round(statistics.fmean(queries), 1),
+        'throughput_rps': round(len(latencies) / wall, 1),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 2),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p90_ms': round(percentile(latencies, 90) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'max_ms': round(latencies[-1] * 1000, 2),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=basedir,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_benchmarks(args):
+    from app import app, db, User, Trek
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        trek_ids = [trek_id for (trek_id,) in db.session.query(Trek.id)]
+        user_ids = [user_id for (user_id,) in db.session.query(User.id).order_by(User.id)]
+        counts = {'users': len(user_ids), 'treks': len(trek_ids)}
+
+    results = {}
+    for name in args.routes:
+        results[name] = benchmark_route(app, name, args, trek_ids, user_ids)
+        stats = results[name]
+        print(f"  {name:<22} {stats['throughput_rps']:>8.1f} req/s  p50 {stats['p50_ms']:>8.2f} ms  "
+              f"p99 {stats['p99_ms']:>8.2f} ms  {stats['db_queries']:>7.1f} queries  errors {stats['errors']}", file=sys.stderr)
+    return {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'database': args.database_url.split(':', 1)[0],
+            'data': counts,
+            'requests_per_route': args.requests,
+            'concurrency': args.concurrency,
+            'fake_api_latency_ms': args.fake_latency_ms,
+        },
+        'routes': results,
+    }
+
+
+def compare(report, baseline_path, threshold):
+    """Print per-route deltas against a baseline; returns True if nothing regressed"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    ok = True
+    print(f"\nCompared with {baseline_path} (threshold {threshold:g}%):", file=sys.stderr)
+    for name, stats in report['routes'].items():
+        before = baseline.get('routes', {}).get(name)
+        if not before:
+            continue
+        deltas = []
+        for key in ('p50_ms', 'p99_ms', 'throughput_rps', 'db_queries'):
+            if key not in before:
+                continue
+            change = (stats[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+            deltas.append(f"{key} {before[key]} -> {stats[key]} ({change:+.1f}%)")
+            if key in ('p50_ms', 'p99_ms') and change > threshold:
+                ok = False
+        print(f"  {name:<22} " + ', '.join(deltas), file=sys.stderr)
+    print("No regressions." if ok else "Regression above threshold.", file=sys.stderr)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark TrekMate routes')
+    parser.add_argument('--database-url', default=f"sqlite:///{DEFAULT_DATABASE}",
+                        help='database to seed and benchmark (default: a SQLite file in the temp dir)')
+    parser.add_argument('--reseed', action='store_true', help='drop and re-seed the database')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--posts', type=int, default=20000)
+    parser.add_argument('--reactions', type=int, default=200000)
+    parser.add_argument('--post-comments', type=int, default=40000)
+    parser.add_argument('--trek-comments', type=int, default=5000)
+    parser.add_argument('--routes', nargs='+', choices=ROUTES, default=list(ROUTES))
+    parser.add_argument('--requests', type=int, default=200, help='measured requests per route')
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--max-seconds', type=float, default=120,
+                        help='time budget per route for the measured requests (0 = no limit)')
+    parser.add_argument('--concurrency', type=int, default=1, help='client threads per route')
+    parser.add_argument('--fake-latency-ms', type=float, default=0,
+                        help='delay added by the fake OpenWeatherMap/SendGrid')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--compare', metavar='BASELINE', help='JSON report to compare against')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='allowed p50/p99 regression in percent for --compare')
+    args = parser.parse_args()
+
+    configure_environment(args, start_fake_apis(args.fake_latency_ms))
+    seed_database(args)
+    report = run_benchmarks(args)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.compare and not compare(report, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Generate responsive WebP/AVIF variants for every image in static/trekimages
+
+Uploaded trek images get their variants when they are saved; this script covers
+the seeded catalog images (and regenerates everything after changing widths).
+Run it as part of the build, after pip install:
+    python build_image_variants.py
+"""
+
+import os
+import time
+
+from app import TREK_IMAGE_FOLDER, IMAGE_VARIANT_FORMATS, generate_image_variants
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.webp', '.gif'}
+
+
+def build_variants():
+    """Generate variants for all catalog images"""
+    if not IMAGE_VARIANT_FORMATS:
+        print("Pillow with WebP/AVIF support is required; nothing to do.")
+        return
+    names = sorted(
+        entry.name for entry in os.scandir(TREK_IMAGE_FOLDER)
+        if entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS
+    )
+    print(f"Generating {', '.join(IMAGE_VARIANT_FORMATS)} variants for {len(names)} images")
+    before = after = 0
+    for name in names:
+        start = time.perf_counter()
+        src = os.path.join(TREK_IMAGE_FOLDER, name)
+        try:
+            written = generate_image_variants(src)
+        except Exception as e:
+            print(f"  ! {name}: {e}")
+            continue
+        before += os.path.getsize(src)
+        smallest = min((n for n in written if n.endswith('.webp')), default=None)
+        if smallest:
+            after += os.path.getsize(os.path.join(TREK_IMAGE_FOLDER, 'variants', smallest))
+        print(f"  - {name}: {len(written)} variants in {time.perf_counter() - start:.1f}s")
+    if after:
+        print(f"Originals: {before / 1024 / 1024:.1f} MiB, smallest WebP set: {after / 1024 / 1024:.1f} MiB")
+
+
+if __name__ == '__main__':
+    build_variants()
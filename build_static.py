@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Build fingerprinted, minified and precompressed static assets
+
+Mirrors static/ into static/dist/ with a content hash in every filename
+(style.css -> dist/style.1a2b3c4d.css), minifies CSS/JS, recompresses PNGs
+losslessly when that makes them smaller (JPEGs are copied byte-for-byte; the
+lossy WebP/AVIF variants come from build_image_variants.py), and writes
+.gz/.br siblings for text assets. The app reads static/dist/manifest.json and rewrites url_for('static', ...) to the
+hashed names, so those URLs can be cached forever.
+
+Run after changing anything under static/:
+    python build_static.py
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+
+try:
+    from PIL import Image
+except Exception:
+    Image = None
+
+# Optional: brotli compresses CSS/JS ~15-20% smaller than gzip
+try:
+    import brotli
+except Exception:
+    brotli = None
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+STATIC_DIR = os.path.join(basedir, 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_NAME = 'manifest.json'
+
+# Runtime-written / generated folders are never fingerprinted
+SKIP_DIRS = {'dist', 'uploads', 'trekimages/variants'}
+TEXT_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt'}
+# Only formats Pillow can recompress without touching the pixels
+LOSSLESS_IMAGE_EXTENSIONS = {'.png'}
+HASH_LENGTH = 8
+
+CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+# Quoted strings are copied verbatim; everything between them is minified
+CSS_STRING = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')''')
+CSS_URL = re.compile(r'''url\(\s*(['"]?)(.*?)\1\s*\)''')
+CSS_SPACE = re.compile(r'\s+')
+CSS_PUNCT = re.compile(r'\s*([{};,>])\s*')
+
+
+def minify_css(text):
+    """Strip comments and redundant whitespace from a stylesheet"""
+    text = CSS_COMMENT.sub('', text)
+    parts = CSS_STRING.split(text)
+    for i in range(0, len(parts), 2):
+        chunk = CSS_SPACE.sub(' ', parts[i])
+        chunk = CSS_PUNCT.sub(r'\1', chunk)
+        parts[i] = chunk.replace(': ', ':').replace(';}', '}')
+    return ''.join(parts).strip()
+
+
+def minify_js(text):
+    """Conservative JS minifier: drop indentation, blank and comment-only lines
+
+    Newlines are kept so automatic semicolon insertion behaves exactly as in the
+    source, and lines inside multi-line template literals are left untouched.
+    """
+    out = []
+    in_template = False
+    for line in text.splitlines():
+        if in_template:
+            out.append(line)
+        else:
+            stripped = line.strip()
+            if not stripped or stripped.startswith('//'):
+                continue
+            out.append(stripped)
+        if (line.count('`') - line.count('\\`')) % 2:
+            in_template = not in_template
+    return '\n'.join(out) + '\n'
+
+
+def optimize_image(data):
+    """Recompress a PNG losslessly and keep the result only if smaller
+
+    Same pixels, EXIF (orientation) and colour profile; only the deflate
+    stream changes.
+    """
+    if Image is None:
+        return data
+    import io
+    try:
+        with Image.open(io.BytesIO(data)) as im:
+            buf = io.BytesIO()
+            metadata = {key: im.info[key] for key in ('exif', 'icc_profile', 'gamma', 'dpi') if im.info.get(key)}
+            im.save(buf, format='PNG', optimize=True, **metadata)
+    except Exception:
+        return data
+    smaller = buf.getvalue()
+    return smaller if len(smaller) < len(data) else data
+
+
+def fingerprint(rel_path, data):
+    """Insert a short content hash before the extension"""
+    digest = hashlib.md5(data).hexdigest()[:HASH_LENGTH]
+    stem, ext = os.path.splitext(rel_path)
+    return f"{stem}.{digest}{ext}"
+
+
+def write_asset(rel_path, data, compress):
+    """Write a built asset (and its precompressed siblings) under dist/"""
+    out_path = os.path.join(DIST_DIR, rel_path)
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    with open(out_path, 'wb') as f:
+        f.write(data)
+    if not compress:
+        return
+    with open(out_path + '.gz', 'wb') as f:
+        # mtime=0 keeps the .gz byte-identical across builds
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(out_path + '.br', 'wb') as f:
+            f.write(brotli.compress(data, quality=11))
+
+
+def iter_static_files():
+    """Yield static/ paths relative to static/, skipping runtime folders"""
+    for root, dirs, files in os.walk(STATIC_DIR):
+        rel_root = os.path.relpath(root, STATIC_DIR)
+        prefix = '' if rel_root == '.' else rel_root.replace(os.sep, '/') + '/'
+        dirs[:] = [d for d in dirs if prefix + d not in SKIP_DIRS]
+        for name in sorted(files):
+            rel = os.path.normpath(os.path.join(rel_root, name))
+            yield rel.replace(os.sep, '/')
+
+
+def rewrite_css_urls(css, css_rel_path, manifest):
+    """Point relative url(...) references at their fingerprinted names"""
+    css_dir = os.path.dirname(css_rel_path)
+
+    def replace(match):
+        target = match.group(2).replace('\\ ', ' ')
+        if re.match(r'^(?:[a-z]+:|//|#|/)', target):
+            return match.group(0)
+        logical = os.path.normpath(os.path.join(css_dir, target)).replace(os.sep, '/')
+        hashed = manifest.get(logical)
+        if not hashed:
+            return match.group(0)
+        # dist/ mirrors static/, so the relative path from the CSS still applies
+        relative = os.path.relpath(hashed, css_dir or '.').replace(os.sep, '/')
+        return f"url('{relative}')"
+
+    return CSS_URL.sub(replace, css)
+
+
+def build(optimize_images=True):
+    """Build dist/ and return the logical -> fingerprinted manifest"""
+    if os.path.isdir(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+    os.makedirs(DIST_DIR)
+
+    manifest = {}
+    stylesheets = []
+    original_bytes = built_bytes = 0
+
+    # Pass 1: everything except CSS, so stylesheets can reference hashed images
+    for rel in iter_static_files():
+        ext = os.path.splitext(rel)[1].lower()
+        if ext == '.css':
+            stylesheets.append(rel)
+            continue
+        with open(os.path.join(STATIC_DIR, rel), 'rb') as f:
+            data = f.read()
+        original_bytes += len(data)
+        if ext == '.js':
+            data = minify_js(data.decode('utf-8')).encode('utf-8')
+        elif ext in LOSSLESS_IMAGE_EXTENSIONS and optimize_images:
+            data = optimize_image(data)
+        hashed = fingerprint(rel, data)
+        write_asset(hashed, data, ext in TEXT_EXTENSIONS)
+        manifest[rel] = hashed
+        built_bytes += len(data)
+
+    # Pass 2: stylesheets
+    for rel in stylesheets:
+        with open(os.path.join(STATIC_DIR, rel), 'r', encoding='utf-8') as f:
+            css = f.read()
+        original_bytes += len(css.encode('utf-8'))
+        css = minify_css(rewrite_css_urls(css, rel, manifest))
+        data = css.encode('utf-8')
+        hashed = fingerprint(rel, data)
+        write_asset(hashed, data, True)
+        manifest[rel] = hashed
+        built_bytes += len(data)
+
+    with open(os.path.join(DIST_DIR, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True, ensure_ascii=False)
+
+    print(f"Built {len(manifest)} assets into {os.path.relpath(DIST_DIR, basedir)}/")
+    print(f"  {original_bytes / 1024:.0f} KiB -> {built_bytes / 1024:.0f} KiB before transfer compression")
+    if brotli is None:
+        print("  brotli not installed; wrote .gz only")
+    return manifest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build fingerprinted static assets')
+    parser.add_argument('--no-optimize-images', action='store_true',
+                        help='copy PNGs as-is instead of recompressing them')
+    args = parser.parse_args()
+    build(optimize_images=not args.no_optimize_images)
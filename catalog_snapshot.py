@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Export the trek catalog to a snapshot file and load it back
+
+Moves regions, treks, routes and highlights between environments without
+re-running import_trek_data.py. A snapshot is gzip-compressed JSON Lines:
+
+    {"format": "trekmate-catalog", "version": 1, "exported_at": ..., "tables": [...]}
+    {"table": "treks", "columns": ["id", "name", ...]}
+    [1, "Rajgad Fort", ...]                  one compact array per row
+    {"end": "treks", "rows": 28, "sha256": "..."}
+    ...
+
+Each table block carries a SHA-256 of its row lines, so a truncated or
+edited file is rejected before anything is written. Importing makes the
+catalog identical to the snapshot (ids included) in a single transaction:
+rows are diffed by id and only inserts, updates and deletes are applied, so
+user data pointing at unchanged treks is untouched. Deleting a trek that
+users have saved or commented on aborts the import, and so does a trek id
+whose name differs from the snapshot's: that id holds a different trek here,
+and overwriting it would move its saves and reviews to the wrong trek (pass
+--allow-renames when the treks were only renamed).
+
+    python catalog_snapshot.py export catalog.jsonl.gz
+    python catalog_snapshot.py import catalog.jsonl.gz --dry-run
+    python catalog_snapshot.py import catalog.jsonl.gz
+
+Image files aren't part of the snapshot. Pass --images DIR to copy and process
+the catalog images from DIR after importing (see import_trek_images.py).
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+from datetime import date, datetime
+
+from sqlalchemy import Date, DateTime, delete, insert, select, update
+
+from app import (
+    app, db, TrekRegion, Trek, PrivateRoute, PublicRoute, TrekHighlight,
+    SavedTrek, TrekComment, AdminNotification, TrekRatingStats,
+)
+from import_trek_images import import_images
+
+SNAPSHOT_FORMAT = 'trekmate-catalog'
+SNAPSHOT_VERSION = 1
+# Parents before children
+CATALOG_MODELS = (TrekRegion, Trek, PrivateRoute, PublicRoute, TrekHighlight)
+BATCH_SIZE = 1000
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _row_line(row):
+    return json.dumps([_json_value(value) for value in row], ensure_ascii=False, separators=(',', ':'))
+
+
+def export_snapshot(path):
+    """Write every catalog table to `path`; returns {table: rows}"""
+    counts = {}
+    with gzip.open(path, 'wt', encoding='utf-8') as out:
+        out.write(json.dumps({
+            'format': SNAPSHOT_FORMAT,
+            'version': SNAPSHOT_VERSION,
+            'exported_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'tables': [model.__tablename__ for model in CATALOG_MODELS],
+        }) + '\n')
+        for model in CATALOG_MODELS:
+            table = model.__table__
+            columns = [column.name for column in table.columns]
+            out.write(json.dumps({'table': table.name, 'columns': columns}) + '\n')
+            digest = hashlib.sha256()
+            rows = 0
+            result = db.session.execute(select(table).order_by(table.c.id).execution_options(yield_per=BATCH_SIZE))
+            for row in result:
+                line = _row_line(row) + '\n'
+                digest.update(line.encode('utf-8'))
+                out.write(line)
+                rows += 1
+            out.write(json.dumps({'end': table.name, 'rows': rows, 'sha256': digest.hexdigest()}) + '\n')
+            counts[table.name] = rows
+    return counts
+
+
+def _converters(table, columns):
+    converters = []
+    for name in columns:
+        column = table.c.get(name)
+        if column is None:
+            raise SnapshotError(f"{table.name}.{name} doesn't exist in this database (run update_db.py?)")
+        if isinstance(column.type, DateTime):
+            converters.append(lambda value: datetime.fromisoformat(value) if value else None)
+        elif isinstance(column.type, Date):
+            converters.append(lambda value: date.fromisoformat(value) if value else None)
+        else:
+            converters.append(None)
+    return converters
+
+
+def read_snapshot(path):
+    """Parse and verify a snapshot; returns {table: (columns, [row tuples])}"""
+    models = {model.__tablename__: model for model in CATALOG_MODELS}
+    tables = {}
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        header = json.loads(f.readline() or 'null')
+        if not isinstance(header, dict) or header.get('format') != SNAPSHOT_FORMAT:
+            raise SnapshotError(f"{path} is not a catalog snapshot")
+        if header.get('version') != SNAPSHOT_VERSION:
+            raise SnapshotError(f"Unsupported snapshot version {header.get('version')} "
+                                f"(this code reads version {SNAPSHOT_VERSION})")
+        current = None
+        for line in f:
+            if current is None:
+                block = json.loads(line)
+                name = block.get('table')
+                if name not in models:
+                    raise SnapshotError(f"Unexpected table {name!r} in snapshot")
+                table = models[name].__table__
+                columns = block['columns']
+                current = (name, columns, _converters(table, columns), hashlib.sha256(), [])
+                continue
+            name, columns, converters, digest, rows = current
+            if line.startswith('{'):
+                trailer = json.loads(line)
+                if trailer.get('end') != name:
+                    raise SnapshotError(f"Malformed snapshot: {name} block isn't closed")
+                if trailer.get('rows') != len(rows) or trailer.get('sha256') != digest.hexdigest():
+                    raise SnapshotError(f"Checksum mismatch in {name}; the snapshot is damaged")
+                tables[name] = (columns, rows)
+                current = None
+                continue
+            digest.update(line.encode('utf-8'))
+            values = json.loads(line)
+            rows.append(tuple(convert(value) if convert else value
+                              for convert, value in zip(converters, values)))
+        if current is not None:
+            raise SnapshotError(f"Snapshot ends inside the {current[0]} block (truncated?)")
+    missing = [name for name in header.get('tables', []) if name not in tables]
+    if missing:
+        raise SnapshotError(f"Snapshot is missing tables: {', '.join(missing)}")
+    return tables
+
+
+def _diff_table(model, columns, rows):
+    """(inserts, updates, stale ids) that turn the table into `rows`"""
+    table = model.__table__
+    existing = {row[0]: tuple(row) for row in db.session.execute(
+        select(*(table.c[name] for name in columns)))}
+    inserts, updates = [], []
+    for row in rows:
+        current = existing.pop(row[0], None)
+        if current is None:
+            inserts.append(dict(zip(columns, row)))
+        elif current != row:
+            updates.append({name: value for name, value, old in zip(columns, row, current)
+                            if value != old or name == 'id'})
+    return inserts, updates, list(existing)
+
+
+def import_snapshot(path, dry_run=False, allow_renames=False):
+    """Make the catalog match the snapshot in one transaction; returns {table: (added, changed, removed)}"""
+    tables = read_snapshot(path)
+    for columns, _ in tables.values():
+        if not columns or columns[0] != 'id':
+            raise SnapshotError("Every snapshot table must start with its id column")
+
+    plans = {}
+    for model in CATALOG_MODELS:
+        columns, rows = tables[model.__tablename__]
+        plans[model] = (columns, *_diff_table(model, columns, rows))
+
+    # Ids are only matched, not checked: a different name means a different trek
+    renamed = sorted(row['id'] for row in plans[Trek][2] if 'name' in row)
+    if renamed and not allow_renames:
+        raise SnapshotError(f"{len(renamed)} trek ids hold a different trek here than in the snapshot "
+                            f"(ids {renamed[:10]}); not importing. Use --allow-renames if they "
+                            f"are the same treks under new names")
+
+    stale_treks = plans[Trek][3]
+    if stale_treks:
+        in_use = {trek_id for model in (SavedTrek, TrekComment, AdminNotification)
+                  for (trek_id,) in db.session.execute(
+                      select(model.trek_id).where(model.trek_id.in_(stale_treks)).distinct())}
+        if in_use:
+            raise SnapshotError(f"The snapshot drops {len(in_use)} treks that users have saved or "
+                                f"commented on (ids {sorted(in_use)[:10]}); not importing")
+
+    summary = {model.__tablename__: (len(inserts), len(updates), len(stale))
+               for model, (_, inserts, updates, stale) in plans.items()}
+    if dry_run:
+        return summary
+
+    try:
+        for model in CATALOG_MODELS:
+            _, inserts, updates, _ = plans[model]
+            for start in range(0, len(inserts), BATCH_SIZE):
+                db.session.execute(insert(model.__table__), inserts[start:start + BATCH_SIZE])
+            if updates:
+                db.session.execute(update(model), updates)
+        # Children first so foreign keys never dangle; dropped treks have no
+        # comments left, only (zeroed) rating aggregates
+        for start in range(0, len(stale_treks), BATCH_SIZE):
+            db.session.execute(delete(TrekRatingStats)
+                               .where(TrekRatingStats.trek_id.in_(stale_treks[start:start + BATCH_SIZE])))
+        for model in reversed(CATALOG_MODELS):
+            stale = plans[model][3]
+            for start in range(0, len(stale), BATCH_SIZE):
+                db.session.execute(delete(model).where(model.id.in_(stale[start:start + BATCH_SIZE])))
+        if db.engine.dialect.name == 'postgresql':
+            # Rows arrive with explicit ids; move the serial sequences past them
+            for model in CATALOG_MODELS:
+                name = model.__tablename__
+                db.session.execute(db.text(
+                    f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), "
+                    f"COALESCE((SELECT MAX(id) FROM {name}), 1))"
+                ))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export/import the trek catalog as a snapshot')
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_cmd = commands.add_parser('export', help='write the catalog to a snapshot file')
+    export_cmd.add_argument('path', help='output file, e.g. catalog.jsonl.gz')
+    import_cmd = commands.add_parser('import', help='make the catalog match a snapshot file')
+    import_cmd.add_argument('path')
+    import_cmd.add_argument('--dry-run', action='store_true', help='verify and show the changes only')
+    import_cmd.add_argument('--images', metavar='DIR', help='then process the catalog images found in DIR')
+    import_cmd.add_argument('--allow-renames', action='store_true',
+                            help='accept trek ids whose name differs from the snapshot')
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        try:
+            if args.command == 'export':
+                counts = export_snapshot(args.path)
+                print(f"Exported {', '.join(f'{rows} {table}' for table, rows in counts.items())} to {args.path}")
+            else:
+                summary = import_snapshot(args.path, args.dry_run, args.allow_renames)
+                print(("Would apply" if args.dry_run else "Imported") + f" {args.path}:")
+                for table, (added, changed, removed) in summary.items():
+                    print(f"  {table:<16} {added} added, {changed} updated, {removed} removed")
+                if args.images and not args.dry_run:
+                    import_images(args.images)
+        except SnapshotError as e:
+            raise SystemExit(f"Error: {e}")
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Remove uploaded images that no database row references any more
+
+Deleting posts/comments/treks releases their blobs as they go, but files can
+still be orphaned: uploads from before the blob store, forms that failed after
+the file was stored, remote-hosted blobs whose local copy is no longer used,
+and crashed workers. This script builds the set of referenced names (one query
+per table), streams each upload folder with os.scandir and removes (or moves
+to a quarantine folder) every file that is unreferenced and older than the
+grace period. Upload blob rows nobody references are dropped too.
+
+Safe to run while the app is serving; for example from cron:
+    python gc_uploads.py --dry-run
+    python gc_uploads.py --grace-minutes 120 --quarantine /var/tmp/trekmate-orphans
+"""
+
+import argparse
+import os
+import shutil
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+
+from app import (
+    app, db, Trek, TrekPost, TrekComment, UploadBlob, basedir,
+    BLOB_FOLDER, THUMB_FOLDER, TREK_IMAGE_FOLDER, TREK_VARIANT_FOLDER, TREK_IMAGE_MANIFEST,
+    LEGACY_UPLOAD_NAME, thumbnail_name, upload_folder_for, variant_source, _is_url,
+)
+
+DEFAULT_GRACE_MINUTES = 60
+
+
+def referenced_names():
+    """image_filename values (local names only) across every table that holds one"""
+    names = set()
+    for model in (Trek, TrekPost, TrekComment):
+        rows = (db.session.query(model.image_filename)
+                .filter(model.image_filename.isnot(None))
+                .distinct())
+        names.update(value for (value,) in rows if value and not _is_url(value))
+    return names
+
+
+def iter_candidates(folder, cutoff, legacy_only=False):
+    """Yield (name, path) for files in `folder` last modified before `cutoff`"""
+    try:
+        entries = os.scandir(folder)
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            # The catalog images in trekimages/ are not uploads
+            if legacy_only and not LEGACY_UPLOAD_NAME.match(entry.name):
+                continue
+            try:
+                if entry.stat(follow_symlinks=False).st_mtime > cutoff:
+                    continue
+            except FileNotFoundError:
+                continue
+            yield entry.name, entry.path
+
+
+def collect(path, quarantine, dry_run):
+    """Delete (or quarantine) one orphaned file; returns its size"""
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return 0
+    if dry_run:
+        return size
+    try:
+        if quarantine:
+            dest = os.path.join(quarantine, os.path.relpath(path, os.path.join(basedir, 'static')))
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.move(path, dest)
+        else:
+            os.remove(path)
+    except OSError as e:
+        print(f"  ! {path}: {e}")
+        return 0
+    return size
+
+
+def drop_unreferenced_blobs(created_before, dry_run):
+    """Delete upload_blobs rows with no references left (their files are swept separately)"""
+    query = UploadBlob.query.filter(UploadBlob.ref_count <= 0, UploadBlob.created_at < created_before)
+    if dry_run:
+        return query.count()
+    # Re-checked in the DELETE itself so a reference taken meanwhile keeps the row
+    removed = query.delete(synchronize_session=False)
+    db.session.commit()
+    return removed
+
+
+def gc_uploads(grace_minutes=DEFAULT_GRACE_MINUTES, quarantine=None, dry_run=False):
+    """Sweep every upload folder; returns {folder: (files, bytes)}"""
+    cutoff = time.time() - grace_minutes * 60
+    dropped = drop_unreferenced_blobs(datetime.utcnow() - timedelta(minutes=grace_minutes), dry_run)
+
+    live = referenced_names()
+    # Local blob files stay while a blob row still expects them there: a staged
+    # (not yet remote) blob can be referenced by a row created moments ago
+    live.update(filename for (filename,) in
+                db.session.query(UploadBlob.filename)
+                .filter(UploadBlob.url.is_(None),
+                        or_(UploadBlob.ref_count > 0,
+                            UploadBlob.created_at >= datetime.utcnow() - timedelta(minutes=grace_minutes))))
+    live_thumbs = {thumbnail_name(name) for name in live}
+
+    sweeps = [
+        (BLOB_FOLDER, False, lambda name: name in live),
+        (THUMB_FOLDER, False, lambda name: name in live_thumbs),
+        (upload_folder_for('post'), False, lambda name: name in live),
+        (upload_folder_for('comment'), False, lambda name: name in live),
+        (TREK_IMAGE_FOLDER, True, lambda name: name in live),
+    ]
+    stats = {}
+    for folder, legacy_only, keep in sweeps:
+        files = freed = 0
+        for name, path in iter_candidates(folder, cutoff, legacy_only):
+            if keep(name):
+                continue
+            freed += collect(path, quarantine, dry_run)
+            files += 1
+        stats[os.path.relpath(folder, basedir)] = (files, freed)
+
+    # Variants belong to catalog images and trek uploads; drop the rest
+    # (old-style names without the source extension, e.g. rajgad-640.webp, go too)
+    live_sources = set(live)
+    live_sources.update(entry.name for entry in os.scandir(TREK_IMAGE_FOLDER) if entry.is_file())
+    files = freed = 0
+    for name, path in iter_candidates(TREK_VARIANT_FOLDER, cutoff):
+        parsed = variant_source(name)
+        if (parsed and parsed[0] in live_sources) or path == TREK_IMAGE_MANIFEST:
+            continue
+        freed += collect(path, quarantine, dry_run)
+        files += 1
+    stats[os.path.relpath(TREK_VARIANT_FOLDER, basedir)] = (files, freed)
+
+    action = 'Would remove' if dry_run else ('Quarantined' if quarantine else 'Removed')
+    print(f"{'Would drop' if dry_run else 'Dropped'} {dropped} unreferenced upload_blobs rows")
+    for folder, (files, freed) in stats.items():
+        if files:
+            print(f"{action} {files} files ({freed / 1024 / 1024:.1f} MiB) from {folder}/")
+    total = sum(files for files, _ in stats.values())
+    if not total:
+        print("No orphaned files found.")
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Remove orphaned uploaded images')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='only report what would be removed')
+    parser.add_argument('--grace-minutes', type=int, default=DEFAULT_GRACE_MINUTES,
+                        help='skip files/blob rows newer than this (uploads still being submitted)')
+    parser.add_argument('--quarantine', metavar='DIR',
+                        help='move orphans into DIR instead of deleting them')
+    args = parser.parse_args()
+    with app.app_context():
+        gc_uploads(args.grace_minutes, args.quarantine, args.dry_run)
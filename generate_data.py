@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+Generate synthetic users, posts, comments, reactions and notifications for scale testing
+
+Fills the database the app is configured for (DATABASE_URL) on top of the trek
+catalog from import_trek_data.py. Popularity is skewed the way real traffic
+is: a few power users write most posts/comments, and a Zipf distribution
+sends most reactions and comments to a handful of hot posts. Post comments are
+threaded (replies point at an earlier comment on the same post) and every
+reaction/comment/reply notifies its owner like the app does.
+
+Rows are written straight into the tables with precomputed ids: COPY on
+PostgreSQL (psycopg2), executemany of one INSERT elsewhere, so millions of
+rows take minutes instead of the hours the ORM would need.
+
+    python import_trek_data.py
+    python generate_data.py --users 5000 --posts 100000 --reactions 2000000
+
+Every generated user has the password printed at the end.
+"""
+
+import argparse
+import csv
+import io
+import itertools
+import random
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from app import (
+    app, db, User, Trek, TrekComment, SavedTrek, TrekPost, TrekPostReaction,
+    TrekPostComment, AdminNotification, UserNotification, rebuild_rating_stats,
+)
+
+BATCH_SIZE = 10000
+DEFAULT_PASSWORD = 'trekmate123'
+
+FIRST_NAMES = ('Aarav', 'Vivaan', 'Aditya', 'Ishaan', 'Rohan', 'Siddharth', 'Omkar', 'Tejas',
+               'Ananya', 'Diya', 'Saanvi', 'Isha', 'Priya', 'Sneha', 'Gauri', 'Neha')
+LAST_NAMES = ('Patil', 'Joshi', 'Kulkarni', 'Deshmukh', 'Shinde', 'Pawar', 'Jadhav', 'Gokhale',
+              'Sharma', 'Mehta', 'Iyer', 'Naik', 'Kale', 'More', 'Sawant', 'Bhosale')
+WORDS = ('sunrise', 'ridge', 'monsoon', 'fort', 'waterfall', 'trail', 'summit', 'clouds',
+         'forest', 'camp', 'steps', 'cave', 'valley', 'lake', 'buddies', 'weekend')
+RATING_WEIGHTS = (4, 6, 15, 35, 40)  # 1..5 stars; reviews lean positive
+
+
+def sentence(rng, words=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def preview(text, length=50):
+    return text[:length] + '...' if len(text) > length else text
+
+
+class Skewed:
+    """Draw items with Zipf popularity (exponent `s`) over a shuffled rank order"""
+
+    def __init__(self, items, s, rng):
+        self.items = list(items)
+        rng.shuffle(self.items)
+        self.rng = rng
+        total = 0.0
+        self.cum_weights = []
+        for rank in range(1, len(self.items) + 1):
+            total += rank ** -s
+            self.cum_weights.append(total)
+
+    def draw(self, k=1):
+        return self.rng.choices(self.items, cum_weights=self.cum_weights, k=k)
+
+    def one(self):
+        return self.draw()[0]
+
+
+# =============================
+# Bulk writing
+# =============================
+class BulkWriter:
+    """Buffers rows for one table and writes them in batches
+
+    Rows are tuples in `columns` order, ids included. Writers listed in
+    `after` are flushed first so foreign keys always point at written rows.
+    """
+
+    def __init__(self, model, columns, after=(), batch_size=BATCH_SIZE):
+        self.table = model.__table__
+        self.columns = columns
+        self.after = after
+        self.batch_size = batch_size
+        self.rows = []
+        self.count = 0
+        connection = db.session.connection()
+        self.use_copy = connection.dialect.name == 'postgresql' and connection.dialect.driver == 'psycopg2'
+        self.insert = self.table.insert()
+
+    def add(self, *row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        for writer in self.after:
+            writer.flush()
+        if not self.rows:
+            return
+        connection = db.session.connection()
+        if self.use_copy:
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(self.rows)
+            buffer.seek(0)
+            with connection.connection.cursor() as cursor:
+                cursor.copy_expert(
+                    f"COPY {self.table.name} ({', '.join(self.columns)}) FROM STDIN WITH (FORMAT csv)",
+                    buffer,
+                )
+        else:
+            connection.execute(self.insert, [dict(zip(self.columns, row)) for row in self.rows])
+        self.count += len(self.rows)
+        self.rows = []
+
+
+def next_id(model):
+    return (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+
+
+def reset_sequences(models):
+    """Generated rows carry explicit ids; move PostgreSQL's serial sequences past them"""
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for model in models:
+        table = model.__table__.name
+        db.session.execute(db.text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"COALESCE((SELECT MAX(id) FROM {table}), 1))"
+        ))
+    db.session.commit()
+
+
+def timestamps(rng, count, start, end):
+    """`count` sorted random datetimes in [start, end]"""
+    span = (end - start).total_seconds()
+    return [start + timedelta(seconds=offset)
+            for offset in sorted(rng.random() * span for _ in range(count))]
+
+
+def later(rng, moment, now, max_hours=72):
+    return min(now, moment + timedelta(minutes=rng.randint(1, max_hours * 60)))
+
+
+# =============================
+# Stages
+# =============================
+def generate_users(rng, count, now, days):
+    probe = User(name='probe', email='probe')
+    # One hash for everyone: hashing each password would dominate the run
+    probe.set_password(DEFAULT_PASSWORD)
+    first_id = next_id(User)
+    users = BulkWriter(User, ('id', 'name', 'email', 'password_hash', 'role', 'created_at'))
+    names = {}
+    for user_id, created_at in zip(itertools.count(first_id),
+                                   timestamps(rng, count, now - timedelta(days=days * 2), now)):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        names[user_id] = name
+        users.add(user_id, name, f"user{user_id}@example.com", probe.password_hash, 'user', created_at)
+    users.flush()
+    db.session.commit()
+    return names
+
+
+def generate_saved_treks(rng, user_ids, treks):
+    saved = BulkWriter(SavedTrek, ('id', 'user_id', 'trek_id'))
+    saved_id = next_id(SavedTrek)
+    for user_id in user_ids:
+        # Most people save a couple of treks; some bookmark a dozen
+        wanted = min(len(treks.items), rng.choices((0, 1, 2, 3, 5, 8, 12), (20, 25, 20, 15, 10, 7, 3))[0])
+        for trek_id in set(treks.draw(wanted)):
+            saved.add(saved_id, user_id, trek_id)
+            saved_id += 1
+    saved.flush()
+    db.session.commit()
+    return saved.count
+
+
+def generate_trek_comments(rng, count, users, treks, names, trek_names, now, days):
+    comments = BulkWriter(TrekComment, ('id', 'trek_id', 'user_id', 'comment', 'rating', 'created_at'))
+    notifications = BulkWriter(
+        AdminNotification, ('id', 'type', 'message', 'trek_id', 'comment_id', 'user_id', 'is_read', 'created_at'),
+        after=(comments,),
+    )
+    comment_id = next_id(TrekComment)
+    notification_id = next_id(AdminNotification)
+    read_before = now - timedelta(days=7)
+    for created_at in timestamps(rng, count, now - timedelta(days=days), now):
+        trek_id, user_id = treks.one(), users.one()
+        text = sentence(rng, rng.randint(6, 40))
+        comments.add(comment_id, trek_id, user_id, text, rng.choices(range(1, 6), RATING_WEIGHTS)[0], created_at)
+        notifications.add(notification_id, 'new_comment',
+                          f"{names[user_id]} commented on {trek_names[trek_id]}: '{preview(text)}'",
+                          trek_id, comment_id, user_id, created_at < read_before, created_at)
+        comment_id += 1
+        notification_id += 1
+    notifications.flush()
+    # The per-trek rating aggregates pages read instead of scanning comments
+    rebuild_rating_stats()
+    db.session.commit()
+    return comments.count, notifications.count
+
+
+def generate_posts(rng, count, users, treks, trek_names, now, days):
+    """Returns [(post_id, owner_id, created_at)] in id (= time) order"""
+    posts = BulkWriter(TrekPost, ('id', 'user_id', 'trek_name', 'trek_date', 'trek_location', 'caption',
+                                  'looking_for_buddies', 'trek_status', 'created_at'))
+    post_id = next_id(TrekPost)
+    created = []
+    for created_at in timestamps(rng, count, now - timedelta(days=days), now):
+        user_id, trek_id = users.one(), treks.one()
+        status = rng.choice(('going', 'completed', None))
+        trek_date = (created_at + timedelta(days=rng.randint(1, 30)) if status == 'going'
+                     else created_at - timedelta(days=rng.randint(0, 30)))
+        posts.add(post_id, user_id, trek_names[trek_id], trek_date.date(), 'Maharashtra',
+                  sentence(rng, rng.randint(5, 30)), rng.random() < 0.3, status, created_at)
+        created.append((post_id, user_id, created_at))
+        post_id += 1
+    posts.flush()
+    db.session.commit()
+    return created
+
+
+def generate_post_comments(rng, count, posts, hot_posts, users, names, reply_ratio, now):
+    comments = BulkWriter(TrekPostComment, ('id', 'post_id', 'user_id', 'parent_id', 'content', 'created_at'))
+    notifications = BulkWriter(
+        UserNotification, ('id', 'recipient_id', 'type', 'message', 'post_id', 'comment_id', 'is_read', 'created_at'),
+        after=(comments,),
+    )
+    comment_id = next_id(TrekPostComment)
+    notification_id = next_id(UserNotification)
+    read_before = now - timedelta(days=3)
+    per_post = Counter(hot_posts.draw(count))
+    for index, (post_id, owner_id, posted_at) in enumerate(posts):
+        thread = []  # (comment_id, user_id) on this post so far
+        moment = posted_at
+        for _ in range(per_post.get(index, 0)):
+            moment = later(rng, moment, now, max_hours=12)
+            user_id = users.one()
+            parent_id, recipient_id, kind = None, owner_id, 'comment'
+            if thread and rng.random() < reply_ratio:
+                parent_id, recipient_id = rng.choice(thread)
+                kind = 'reply'
+            comments.add(comment_id, post_id, user_id, parent_id, sentence(rng, rng.randint(3, 25)), moment)
+            if recipient_id != user_id:
+                message = (f"{names[user_id]} replied to your comment." if kind == 'reply'
+                           else f"{names[user_id]} commented on your post.")
+                notifications.add(notification_id, recipient_id, kind, message, post_id, comment_id,
+                                  moment < read_before, moment)
+                notification_id += 1
+            thread.append((comment_id, user_id))
+            comment_id += 1
+    notifications.flush()
+    db.session.commit()
+    return comments.count, notifications.count
+
+
+def generate_reactions(rng, count, posts, hot_posts, users, user_ids, names, now):
+    reactions = BulkWriter(TrekPostReaction, ('id', 'post_id', 'user_id', 'created_at'))
+    notifications = BulkWriter(
+        UserNotification, ('id', 'recipient_id', 'type', 'message', 'post_id', 'is_read', 'created_at'),
+        after=(reactions,),
+    )
+    reaction_id = next_id(TrekPostReaction)
+    notification_id = next_id(UserNotification)
+    read_before = now - timedelta(days=3)
+    # A post can't collect more reactions than there are users; cap hot posts at half
+    limit = max(1, len(user_ids) // 2)
+    per_post = Counter(hot_posts.draw(count))
+    for index, (post_id, owner_id, posted_at) in enumerate(posts):
+        wanted = min(per_post.get(index, 0), limit)
+        if not wanted:
+            continue
+        reactors = set(users.draw(wanted))
+        while len(reactors) < wanted:
+            reactors.add(rng.choice(user_ids))
+        for user_id in reactors:
+            moment = later(rng, posted_at, now)
+            reactions.add(reaction_id, post_id, user_id, moment)
+            reaction_id += 1
+            if user_id != owner_id:
+                notifications.add(notification_id, owner_id, 'reaction', f"{names[user_id]} reacted to your post.",
+                                  post_id, moment < read_before, moment)
+                notification_id += 1
+    notifications.flush()
+    db.session.commit()
+    return reactions.count, notifications.count
+
+
+def generate(users=1000, posts=10000, reactions=100000, post_comments=30000, trek_comments=2000,
+             skew=1.0, reply_ratio=0.35, days=365, seed=42, log=print):
+    """Generate every table in dependency order; returns {table: rows written}"""
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    trek_names = dict(db.session.query(Trek.id, Trek.name))
+    if not trek_names:
+        raise SystemExit("No treks found; run import_trek_data.py first.")
+
+    counts = {}
+    started = time.perf_counter()
+
+    def stage(**rows):
+        nonlocal started
+        elapsed = max(time.perf_counter() - started, 1e-6)
+        for table, written in rows.items():
+            counts[table] = counts.get(table, 0) + written
+        written = ', '.join(f"{count:,} {table}" for table, count in rows.items())
+        log(f"  {written} in {elapsed:.1f}s ({sum(rows.values()) / elapsed:,.0f} rows/s)")
+        started = time.perf_counter()
+
+    names = generate_users(rng, users, now, days)
+    stage(users=len(names))
+    user_ids = list(names)
+    active_users = Skewed(user_ids, skew, rng)
+    popular_treks = Skewed(trek_names, 0.8, rng)
+
+    stage(saved_treks=generate_saved_treks(rng, user_ids, popular_treks))
+    written, notified = generate_trek_comments(rng, trek_comments, active_users, popular_treks,
+                                               names, trek_names, now, days)
+    stage(trek_comments=written, admin_notifications=notified)
+
+    post_rows = generate_posts(rng, posts, active_users, popular_treks, trek_names, now, days)
+    stage(trek_posts=len(post_rows))
+    hot_posts = Skewed(range(len(post_rows)), skew, rng)
+    written, notified = generate_post_comments(rng, post_comments, post_rows, hot_posts, active_users,
+                                               names, reply_ratio, now)
+    stage(trek_post_comments=written, user_notifications=notified)
+    written, notified = generate_reactions(rng, reactions, post_rows, hot_posts, active_users,
+                                           user_ids, names, now)
+    stage(trek_post_reactions=written, user_notifications=notified)
+
+    reset_sequences((User, SavedTrek, TrekComment, AdminNotification, TrekPost,
+                     TrekPostComment, TrekPostReaction, UserNotification))
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate synthetic data for scale testing')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--posts', type=int, default=10000, help='feed posts')
+    parser.add_argument('--reactions', type=int, default=100000,
+                        help='target count; a post gets at most half the users as reactors')
+    parser.add_argument('--post-comments', type=int, default=30000, help='feed comments (threaded)')
+    parser.add_argument('--trek-comments', type=int, default=2000, help='trek reviews')
+    parser.add_argument('--skew', type=float, default=1.0,
+                        help='Zipf exponent for user activity and post popularity (0 = uniform)')
+    parser.add_argument('--reply-ratio', type=float, default=0.35,
+                        help='share of feed comments that reply to an earlier comment')
+    parser.add_argument('--days', type=int, default=365, help='spread activity over this many days')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        print(f"Generating into {db.engine.url.render_as_string(hide_password=True)}")
+        total = time.perf_counter()
+        counts = generate(args.users, args.posts, args.reactions, args.post_comments, args.trek_comments,
+                          args.skew, args.reply_ratio, args.days, args.seed)
+        print(f"Done: {sum(counts.values()):,} rows in {time.perf_counter() - total:.1f}s. "
+              f"Generated users log in with password '{DEFAULT_PASSWORD}'.")
@@ -0,0 +1,28 @@
+"""
+Gunicorn settings (picked up automatically when gunicorn starts in this folder)
+
+Each worker is a separate process, so Prometheus metrics are written to a
+shared directory and merged by /metrics (prometheus_client multiprocess mode).
+"""
+
+import os
+import shutil
+import tempfile
+
+metrics_dir = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'trekmate-metrics')
+)
+
+
+def on_starting(server):
+    # Samples left by a previous run would otherwise be merged into this one
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,120 +1,34 @@
 #!/usr/bin/env python3
 """
 Script to import trek data from trekdata.txt into the database
-This script will parse all 28 treks and store every single detail without losing any information
+trekdata.txt is parsed as a stream (regions, trek sections, routes, highlights)
+and synced into the catalog. The file is authoritative: the curated entries
+below only fill in details its parse leaves empty
 """
 
+import argparse
+import os
 import re
-from app import app, db, TrekRegion, Trek, PrivateRoute, PublicRoute, TrekHighlight
+from collections import Counter
+from datetime import datetime
+from itertools import islice
+from sqlalchemy import delete, insert, select, update
+from normalize import (
+    clean_text, parse_height, parse_distance, extract_difficulty_info, parse_route_distance_and_time,
+)
+from app import (
+    app, db, TrekRegion, Trek, PrivateRoute, PublicRoute, TrekHighlight,
+    SavedTrek, TrekComment, AdminNotification, TrekRatingStats,
+)
 
-def clean_text(text):
-    """Clean text by removing emojis and extra whitespace"""
-    if not text:
-        return ""
-    # Remove emojis and special characters but keep essential info
-    emoji_pattern = re.compile("["
-        u"\U0001F600-\U0001F64F"  # emoticons
-        u"\U0001F300-\U0001F5FF"  # symbols & pictographs
-        u"\U0001F680-\U0001F6FF"  # transport & map symbols
-        u"\U0001F1E0-\U0001F1FF"  # flags (iOS)
-        u"\U00002500-\U00002BEF"  # chinese char
-        u"\U00002702-\U000027B0"
-        u"\U00002702-\U000027B0"
-        u"\U000024C2-\U0001F251"
-        u"\U0001f926-\U0001f937"
-        u"\U00010000-\U0010ffff"
-        u"\u2640-\u2642"
-        u"\u2600-\u2B55"
-        u"\u200d"
-        u"\u23cf"
-        u"\u23e9"
-        u"\u231a"
-        u"\ufe0f"  # dingbats
-        u"\u3030"
-        "]+", flags=re.UNICODE)
-    return emoji_pattern.sub('', text).strip()
+def curated_trek_data():
+    """Hand-edited versions of the treks in trekdata.txt
 
-def parse_height(height_text):
-    """Extract height in feet and meters from text"""
-    if not height_text:
-        return None, None
-    
-    # Look for pattern like "4,514 ft (1,376 m)" or "2,160 ft (659 m)"
-    height_match = re.search(r'(\d+,?\d+)\s*ft.*?\((\d+,?\d+)\s*m\)', height_text)
-    if height_match:
-        ft = int(height_match.group(1).replace(',', ''))
-        m = int(height_match.group(2).replace(',', ''))
-        return ft, m
-    
-    # Try just feet
-    ft_match = re.search(r'(\d+,?\d+)\s*ft', height_text)
-    if ft_match:
-        ft = int(ft_match.group(1).replace(',', ''))
-        return ft, None
-    
-    return None, None
-
-def parse_distance(distance_text):
-    """Extract distance in km"""
-    if not distance_text:
-        return None
-    
-    # Look for patterns like "~7 km", "13 km", "3.5 km"
-    dist_match = re.search(r'~?(\d+\.?\d*)\s*km', distance_text)
-    if dist_match:
-        return float(dist_match.group(1))
-    
-    return None
-
-def extract_difficulty_info(difficulty_text):
-    """Extract difficulty level and color code"""
-    if not difficulty_text:
-        return None, None
-    
-    difficulty_map = {
-        'Easy': 'green',
-        'Moderate': 'orange', 
-        'Hard': 'red'
-    }
-    
-    for level, color in difficulty_map.items():
-        if level.lower() in difficulty_text.lower():
-            return level, color
-    
-    return None, None
-
-def parse_route_distance_and_time(route_text):
-    """Parse distance and time from route description"""
-    if not route_text:
-        return None, None
-    
-    # Extract distance like "~60 km", "200 km"
-    dist_match = re.search(r'~?(\d+)\s*km', route_text)
-    distance = int(dist_match.group(1)) if dist_match else None
-    
-    # Extract time like "~2 hrs", "3.5 hrs"  
-    time_match = re.search(r'~?(\d+\.?\d*)\s*hrs?', route_text)
-    duration = f"{time_match.group(1)} hrs" if time_match else None
-    
-    return distance, duration
-
-def parse_trek_data():
-    """Parse the complete trek data from trekdata.txt"""
-    with open('trekdata.txt', 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    lines = content.split('\n')
-    
-    # Define regions from the data
-    regions_data = [
-        "Pune – Lonavala – Mulshi Belt",
-        "Mumbai – Panvel – Karjat – Matheran Belt", 
-        "Nashik – Bhandardara Belt",
-        "Satara – Mahabaleshwar – Kaas Belt",
-        "Malshej Ghat Belt",
-        "Konkan Belt"
-    ]
-    
+    These carry details the source file doesn't always have (road
+    conditions, summed travel times, frequencies). They only fill fields
+    left empty in the parsed record of the trek with the same full name;
+    edits to trekdata.txt always win.
+    """
     # Trek data structure - manually extracted from the file for accuracy
     trek_data = [
         {
@@ -1344,101 +1258,441 @@ def parse_trek_data():
     
     trek_data.extend(konkan_treks)
     
-    return regions_data, trek_data
+    return trek_data
+
+TREKDATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'trekdata.txt')
+
+# Line shapes in trekdata.txt
+TREK_HEADING = re.compile(r'^\W*(\d+)\\?\.\s+(.+)$')  # "🏔️ 1. Rajgad Fort", "5\. Torna Fort"
+FIELD_LINE = re.compile(r'^([A-Za-z][A-Za-z ]{1,29}):\s*(.*)$')  # "Base Village: Gunjavane"
+FROM_LINE = re.compile(r'^From\s+([^:→]+?)\s*(?::\s*(.*)|(→.*))$')  # "From Pune:", "From Pune → NH48 → ..."
+SEPARATOR = re.compile(r'^(\\?_)+$')
+TRAILING_PARENS = re.compile(r'\s*\(([^()]*)\)\s*\.?$')
+LEADING_SYMBOLS = re.compile(r'^[^\w~(]+')  # "⏱️ 2.5–3 hrs" (not every icon is in clean_text's list)
+KEY_CHARS = str.maketrans({'’': "'", '‘': "'", '–': '-', '—': '-'})
+
+def trek_key(full_name):
+    """Match key for a trek heading: case, dash/quote style and spacing don't matter"""
+    return ' '.join(clean_text(full_name).translate(KEY_CHARS).casefold().split())
+
+def field_text(value):
+    return LEADING_SYMBOLS.sub('', clean_text(value))
+
+def new_trek_record(heading, region):
+    full_name = ' '.join(clean_text(heading).split())
+    return {
+        'name': TRAILING_PARENS.sub('', full_name) or full_name,
+        'full_name': full_name,
+        'region': region,
+        'gen_z_intro': '',
+        'private_routes': [],
+        'public_routes': [],
+        'highlights': [],
+    }
+
+def finish_trek_record(trek, section_parking):
+    """Fill gaps left by the free-form route sections"""
+    for route in trek['private_routes']:
+        if not route['parking_info']:
+            route['parking_info'] = section_parking or ''
+    for route in trek['public_routes']:
+        route['route_steps'] = '. '.join(step.rstrip('.') for step in route.pop('steps'))
+        route['total_time'] = ' + '.join(time.lstrip('~') for time in route['total_time'])
+        route['frequency'] = '; '.join(route['frequency'])
+    return trek
+
+def add_private_route(trek, from_city, description=''):
+    route = {'from_city': from_city.strip(), 'route_description': '', 'distance_km': None,
+             'duration': None, 'road_condition': '', 'parking_info': ''}
+    trek['private_routes'].append(route)
+    if description:
+        set_route_description(route, description)
+    return route
+
+def set_route_description(route, text):
+    # "Pune → NH48 → Saswad → Torna Peth (~65 km, ~2 hrs)"
+    route['distance_km'], route['duration'] = parse_route_distance_and_time(text)
+    match = TRAILING_PARENS.search(text)
+    if match and (route['distance_km'] or route['duration']):
+        text = text[:match.start()]
+    route['route_description'] = text.strip().rstrip('.')
 
-def insert_data():
-    """Insert all parsed data into the database"""
-    regions_data, trek_data = parse_trek_data()
+def add_public_route(trek, from_city):
+    route = {'from_city': from_city.strip(), 'steps': [], 'total_time': [], 'frequency': []}
+    trek['public_routes'].append(route)
+    return route
+
+def iter_trek_records(path=TREKDATA_PATH):
+    """Stream trek records out of trekdata.txt, one trek at a time
+
+    The file is read line by line, so memory use doesn't grow with its
+    size. Region headers ("🌄 Pune – Lonavala – Mulshi Belt") set the region
+    of the numbered trek sections that follow; each section has the
+    "Field: value" details, a private vehicle route section, a public
+    transport section and optional route highlights. Records have the same
+    shape as curated_trek_data() entries.
+    """
+    region = None
+    regions = []  # in order of appearance; the table of contents lists them all first
+    trek = None
+    section = None  # None (details), 'private', 'public' or 'highlights'
+    pending = None  # field whose value is on the next line
+    route = None
+    section_parking = None
     
-    with app.app_context():
-        # Create tables
-        db.create_all()
-        
-        # Clear existing data
-        TrekHighlight.query.delete()
-        PublicRoute.query.delete()
-        PrivateRoute.query.delete()
-        Trek.query.delete()
-        TrekRegion.query.delete()
-        db.session.commit()
-        
-        print("Inserting regions...")
-        # Insert regions
-        region_map = {}
-        for region_name in regions_data:
-            clean_name = clean_text(region_name)
-            region = TrekRegion(name=clean_name)
-            db.session.add(region)
-            db.session.flush()  # Get the ID
-            region_map[clean_name] = region.id
-            print(f"Added region: {clean_name}")
-        
-        db.session.commit()
-        
-        print(f"\nInserting {len(trek_data)} treks...")
-        # Insert treks
-        for i, trek in enumerate(trek_data, 1):
-            print(f"Processing trek {i}: {trek['name']}")
+    with open(path, 'r', encoding='utf-8') as f:
+        for raw in f:
+            line = raw.strip()
+            if not line:
+                continue
+            if SEPARATOR.match(line):
+                # The first section after the table of contents has no header of its own
+                if trek is None and regions and region == regions[-1]:
+                    region = regions[0]
+                continue
+            
+            heading = TREK_HEADING.match(line)
+            if heading or line.endswith('Belt'):
+                if trek:
+                    yield finish_trek_record(trek, section_parking)
+                trek, section, pending, route, section_parking = None, None, None, None, None
+                if heading:
+                    trek = new_trek_record(heading.group(2), region)
+                else:
+                    region = clean_text(line)
+                    regions.append(region)
+                continue
+            if trek is None:
+                continue  # table of contents
+            
+            if 'Private Vehicle Route' in line:
+                section, route = 'private', None
+                continue
+            if 'Public Transport Route' in line:
+                for private in trek['private_routes']:
+                    if not private['parking_info']:
+                        private['parking_info'] = section_parking or ''
+                section, route, section_parking = 'public', None, None
+                continue
+            if line.startswith('Route Highlights'):
+                section = 'highlights'
+                continue
             
-            region_id = region_map.get(clean_text(trek['region']))
-            if not region_id:
-                print(f"Warning: Region not found for {trek['name']}: {trek['region']}")
+            if pending:
+                trek[pending] = line.strip('"“”')
+                pending = None
                 continue
             
-            # Create trek
-            new_trek = Trek(
-                name=clean_text(trek['name']),
-                full_name=clean_text(trek['full_name']),
-                gen_z_intro=clean_text(trek['gen_z_intro']),
-                height_ft=trek.get('height_ft'),
-                height_m=trek.get('height_m'),
-                distance_km=trek.get('distance_km'),
-                duration=clean_text(trek.get('duration', '')),
-                difficulty=trek.get('difficulty'),
-                difficulty_color=trek.get('difficulty_color'),
-                best_season=clean_text(trek.get('best_season', '')),
-                base_village=clean_text(trek.get('base_village', '')),
-                region_id=region_id
-            )
-            db.session.add(new_trek)
-            db.session.flush()  # Get the trek ID
+            field = FIELD_LINE.match(line)
+            label, value = (field.group(1).strip(), field.group(2).strip()) if field else (None, None)
+            from_line = FROM_LINE.match(line)
+            
+            if section is None:
+                if label == 'Gen Z Intro':
+                    if value:
+                        trek['gen_z_intro'] = value.strip('"“”')
+                    else:
+                        pending = 'gen_z_intro'
+                elif label == 'Height':
+                    trek['height_ft'], trek['height_m'] = parse_height(value)
+                elif label == 'Distance':
+                    trek['distance_km'] = parse_distance(value)
+                elif label in ('Duration', 'Trek Duration'):
+                    trek['duration'] = field_text(value)
+                elif label == 'Difficulty':
+                    trek['difficulty'], trek['difficulty_color'] = extract_difficulty_info(value)
+                elif label == 'Best Season':
+                    trek['best_season'] = field_text(value)
+                elif label == 'Base Village':
+                    trek['base_village'] = field_text(value)
+            
+            elif section == 'private':
+                if from_line:
+                    city, text, arrows = from_line.groups()
+                    route = add_private_route(trek, city, text if arrows is None else f"{city} {arrows}")
+                elif label == 'Distance' and route:
+                    route['distance_km'], route['duration'] = parse_route_distance_and_time(value)
+                elif label == 'Road Condition' and route:
+                    route['road_condition'] = value
+                elif line.startswith('Parking'):
+                    parking = value if label == 'Parking' else line
+                    section_parking = parking
+                    if route and not route['parking_info']:
+                        route['parking_info'] = parking
+                elif route and not route['route_description']:
+                    set_route_description(route, line)
+                elif '→' in line:
+                    route = add_private_route(trek, line.split('→', 1)[0], line)
+                elif route:
+                    route['route_description'] += ' ' + line.rstrip('.')
             
-            # Insert private routes
-            for route in trek.get('private_routes', []):
-                private_route = PrivateRoute(
-                    trek_id=new_trek.id,
-                    from_city=clean_text(route.get('from_city', '')),
-                    route_description=clean_text(route.get('route_description', '')),
-                    distance_km=route.get('distance_km'),
-                    duration=clean_text(route.get('duration', '')),
-                    road_condition=clean_text(route.get('road_condition', '')),
-                    parking_info=clean_text(route.get('parking_info', ''))
-                )
-                db.session.add(private_route)
+            elif section == 'public':
+                if from_line and from_line.group(2) is not None:
+                    route = add_public_route(trek, from_line.group(1))
+                    if from_line.group(2):
+                        route['steps'].append(from_line.group(2))
+                elif label == 'Total Time' and route:
+                    route['total_time'].append(value)
+                elif label == 'Frequency' and route:
+                    route['frequency'].append(value)
+                else:
+                    if route is None:
+                        route = add_public_route(trek, line.split('→', 1)[0])
+                    route['steps'].append(line)
             
-            # Insert public routes
-            for route in trek.get('public_routes', []):
-                public_route = PublicRoute(
-                    trek_id=new_trek.id,
-                    from_city=clean_text(route.get('from_city', '')),
-                    route_steps=clean_text(route.get('route_steps', '')),
-                    total_time=clean_text(route.get('total_time', '')),
-                    frequency=clean_text(route.get('frequency', ''))
-                )
-                db.session.add(public_route)
+            elif section == 'highlights':
+                trek['highlights'].append(line)
+    
+    if trek:
+        yield finish_trek_record(trek, section_parking)
+
+def _is_empty(value):
+    return value is None or value == '' or value == []
+
+def fill_empty_fields(record, fallback):
+    """Copy values from `fallback` into the fields `record` has no value for"""
+    for field, value in fallback.items():
+        if _is_empty(record.get(field)) and not _is_empty(value):
+            record[field] = value
+    return record
+
+def fill_from_curated(trek, curated):
+    """Complete a parsed trek with its curated entry; parsed values always win
+
+    Routes present in both are matched by city (else by position) and only
+    their empty fields are filled; route lists the parse found nothing for
+    are taken whole.
+    """
+    for kind in ('private_routes', 'public_routes'):
+        extra = curated.get(kind) or []
+        by_city = {trek_key(route['from_city']): route for route in extra}
+        for index, route in enumerate(trek[kind]):
+            match = by_city.get(trek_key(route['from_city']))
+            if match is None and index < len(extra):
+                match = extra[index]
+            if match is not None:
+                fill_empty_fields(route, match)
+    return fill_empty_fields(trek, curated)
+
+def parse_trek_data(path=TREKDATA_PATH):
+    """Yield the treks to import: parsed from trekdata.txt, completed from the curated entries
+
+    Only treks in the file are yielded; removing a trek from the file removes
+    it from the catalog (with --prune).
+    """
+    curated = {trek_key(trek['full_name']): trek for trek in curated_trek_data()}
+    for trek in iter_trek_records(path):
+        entry = curated.get(trek_key(trek['full_name']))
+        yield fill_from_curated(trek, entry) if entry else trek
+
+def insert_rows(model, rows, returning=False):
+    """Insert a list of column dicts with one executemany statement
+
+    With returning=True the new ids come back in the order of `rows`
+    (batched INSERT ... RETURNING), so child rows can be linked without a
+    flush per object.
+    """
+    if not rows:
+        return []
+    stmt = insert(model)
+    if returning:
+        stmt = stmt.returning(model.id, sort_by_parameter_order=True)
+        return list(db.session.execute(stmt, rows).scalars())
+    db.session.execute(stmt, rows)
+    return []
+
+def build_trek_rows(trek, region_id):
+    """Column dicts for one parsed trek: (trek, private routes, public routes, highlights)"""
+    trek_row = {
+        'name': clean_text(trek['name']),
+        'full_name': clean_text(trek['full_name']),
+        'gen_z_intro': clean_text(trek['gen_z_intro']),
+        'height_ft': trek.get('height_ft'),
+        'height_m': trek.get('height_m'),
+        'distance_km': trek.get('distance_km'),
+        'duration': clean_text(trek.get('duration', '')),
+        'difficulty': trek.get('difficulty'),
+        'difficulty_color': trek.get('difficulty_color'),
+        'best_season': clean_text(trek.get('best_season', '')),
+        'base_village': clean_text(trek.get('base_village', '')),
+        'region_id': region_id,
+    }
+    private_routes = [{
+        'from_city': clean_text(route.get('from_city', '')),
+        'route_description': clean_text(route.get('route_description', '')),
+        'distance_km': route.get('distance_km'),
+        'duration': clean_text(route.get('duration', '')),
+        'road_condition': clean_text(route.get('road_condition', '')),
+        'parking_info': clean_text(route.get('parking_info', '')),
+    } for route in trek.get('private_routes', [])]
+    public_routes = [{
+        'from_city': clean_text(route.get('from_city', '')),
+        'route_steps': clean_text(route.get('route_steps', '')),
+        'total_time': clean_text(route.get('total_time', '')),
+        'frequency': clean_text(route.get('frequency', '')),
+    } for route in trek.get('public_routes', [])]
+    highlights = [{'highlight': clean_text(text)} for text in trek.get('highlights', [])]
+    return trek_row, private_routes, public_routes, highlights
+
+# Columns compared on sync; treks and regions are matched by name
+TREK_FIELDS = ('full_name', 'gen_z_intro', 'height_ft', 'height_m', 'distance_km', 'duration',
+               'difficulty', 'difficulty_color', 'best_season', 'base_village', 'region_id')
+PRIVATE_ROUTE_FIELDS = ('from_city', 'route_description', 'distance_km', 'duration',
+                        'road_condition', 'parking_info')
+PUBLIC_ROUTE_FIELDS = ('from_city', 'route_steps', 'total_time', 'frequency')
+HIGHLIGHT_FIELDS = ('highlight',)
+SYNC_CHUNK = 500  # treks diffed and written per round trip
+
+def delete_ids(model, ids):
+    if ids:
+        db.session.execute(delete(model).where(model.id.in_(ids)))
+
+def sync_children(model, fields, desired_by_trek):
+    """Diff one route/highlight table against the parsed rows of the given treks
+
+    Rows are matched by content: unchanged rows keep their ids, edited rows
+    are replaced. Returns (inserted, deleted, ids of treks that changed).
+    """
+    existing = {}
+    columns = [getattr(model, field) for field in fields]
+    query = select(model.id, model.trek_id, *columns).where(model.trek_id.in_(list(desired_by_trek)))
+    for row in db.session.execute(query):
+        existing.setdefault(row[1], {}).setdefault(tuple(row[2:]), []).append(row[0])
+
+    inserts, stale, changed = [], [], set()
+    for trek_id, rows in desired_by_trek.items():
+        current = existing.get(trek_id, {})
+        for row in rows:
+            ids = current.get(tuple(row[field] for field in fields))
+            if ids:
+                ids.pop()
+            else:
+                inserts.append(dict(row, trek_id=trek_id))
+                changed.add(trek_id)
+        leftover = [row_id for ids in current.values() for row_id in ids]
+        if leftover:
+            stale.extend(leftover)
+            changed.add(trek_id)
+    delete_ids(model, stale)
+    insert_rows(model, inserts)
+    return len(inserts), len(stale), changed
+
+def sync_treks(treks, region_map, stats, now):
+    """Apply one chunk of parsed treks; returns the names it covered"""
+    parsed = {}
+    for trek in treks:
+        region_name = clean_text(trek['region'] or '')
+        if not region_name:
+            print(f"Warning: No region for {trek['name']}; skipped")
+            continue
+        if region_name not in region_map:
+            region_map[region_name], = insert_rows(TrekRegion, [{'name': region_name}], returning=True)
+            stats['new_regions'] += 1
+        trek_row, *trek_children = build_trek_rows(trek, region_map[region_name])
+        if trek_row['name'] in parsed:
+            print(f"Warning: duplicate trek {trek_row['name']!r}; the last one wins")
+        parsed[trek_row['name']] = (trek_row, trek_children)
+    if not parsed:
+        return set()
+    
+    existing = {row.name: row for row in db.session.execute(
+        select(Trek.id, Trek.name, *(getattr(Trek, field) for field in TREK_FIELDS))
+        .where(Trek.name.in_(list(parsed))))}
+    new_names = [name for name in parsed if name not in existing]
+    trek_ids = {row.name: row.id for row in existing.values()}
+    trek_ids.update(zip(new_names, insert_rows(
+        Trek, [dict(parsed[name][0], created_at=now, updated_at=now) for name in new_names],
+        returning=True)))
+    stats['new_treks'] += len(new_names)
+    
+    updates = {}
+    for name, (trek_row, _) in parsed.items():
+        current = existing.get(name)
+        if current is None:
+            continue
+        changes = {field: trek_row[field] for field in TREK_FIELDS
+                   if getattr(current, field) != trek_row[field]}
+        if changes:
+            updates[current.id] = changes
+    
+    touched = set()
+    for index, (model, fields) in enumerate(((PrivateRoute, PRIVATE_ROUTE_FIELDS),
+                                             (PublicRoute, PUBLIC_ROUTE_FIELDS),
+                                             (TrekHighlight, HIGHLIGHT_FIELDS))):
+        desired = {trek_ids[name]: children[index] for name, (_, children) in parsed.items()}
+        inserted, deleted, changed = sync_children(model, fields, desired)
+        stats[f"{model.__tablename__}_added"] += inserted
+        stats[f"{model.__tablename__}_removed"] += deleted
+        touched |= changed
+    
+    # Route/highlight edits count as trek edits for ETags
+    new_ids = {trek_ids[name] for name in new_names}
+    for trek_id in touched - new_ids:
+        updates.setdefault(trek_id, {})
+    if updates:
+        db.session.execute(update(Trek), [dict(changes, id=trek_id, updated_at=now)
+                                          for trek_id, changes in updates.items()])
+    stats['updated'] += len(updates)
+    return set(parsed)
+
+def insert_data(prune=False, path=TREKDATA_PATH):
+    """Sync trekdata.txt into the database
+
+    Treks are streamed from the parser and applied SYNC_CHUNK at a time, so
+    memory stays flat however large the file is. Regions and treks are
+    matched by name so existing ids (and the saved treks, comments and
+    notifications pointing at them) survive re-imports. Only new, changed or
+    removed rows are written, in one transaction, and updated_at moves only
+    for treks that actually changed, so page ETags stay valid for the rest.
+    Treks missing from the source are kept unless `prune` is set (admins can
+    add treks outside trekdata.txt); pruning skips treks that users have
+    saved or commented on.
+    """
+    with app.app_context():
+        # Create tables
+        db.create_all()
+        
+        stats = Counter()
+        seen = set()
+        now = datetime.utcnow()
+        try:
+            region_map = dict(db.session.execute(select(TrekRegion.name, TrekRegion.id)).all())
+            records = iter(parse_trek_data(path))
+            while True:
+                chunk = list(islice(records, SYNC_CHUNK))
+                if not chunk:
+                    break
+                seen |= sync_treks(chunk, region_map, stats, now)
             
-            # Insert highlights if any
-            for highlight_text in trek.get('highlights', []):
-                highlight = TrekHighlight(
-                    trek_id=new_trek.id,
-                    highlight=clean_text(highlight_text)
-                )
-                db.session.add(highlight)
+            removed = [trek_id for name, trek_id in db.session.execute(select(Trek.name, Trek.id))
+                       if name not in seen]
+            pruned = []
+            if removed and prune:
+                in_use = {trek_id for model in (SavedTrek, TrekComment, AdminNotification)
+                          for (trek_id,) in db.session.execute(
+                              select(model.trek_id).where(model.trek_id.in_(removed)).distinct())}
+                pruned = [trek_id for trek_id in removed if trek_id not in in_use]
+                for model in (PrivateRoute, PublicRoute, TrekHighlight, TrekRatingStats):
+                    db.session.execute(delete(model).where(model.trek_id.in_(pruned)))
+                delete_ids(Trek, pruned)
+                used_regions = select(Trek.region_id).where(Trek.region_id.isnot(None))
+                db.session.execute(delete(TrekRegion).where(TrekRegion.id.notin_(used_regions)))
             
-            print(f"  - Added {trek['name']} with {len(trek.get('private_routes', []))} private routes and {len(trek.get('public_routes', []))} public routes")
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
         
-        db.session.commit()
-        print(f"\n✅ Successfully imported all {len(trek_data)} treks with complete data!")
+        print(f"\n✅ Catalog synced: {stats['new_regions']} new regions, {stats['new_treks']} new treks, "
+              f"{stats['updated']} updated, {len(pruned)} removed")
+        for table in ('private_routes', 'public_routes', 'trek_highlights'):
+            inserted, deleted = stats[f"{table}_added"], stats[f"{table}_removed"]
+            if inserted or deleted:
+                print(f"  - {table}: {inserted} added, {deleted} removed")
+        kept = len(removed) - len(pruned)
+        if kept:
+            hint = "still saved/commented on" if prune else "pass --prune to remove them"
+            print(f"  - {kept} treks in the database are not in trekdata.txt ({hint})")
         
         # Verify data
         verify_data()
@@ -1469,7 +1723,11 @@ def verify_data():
             print(f"  - {trek.name} ({trek.region.name}): {trek.height_ft}ft, {trek.difficulty}")
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import/sync the trek catalog from trekdata.txt')
+    parser.add_argument('--source', default=TREKDATA_PATH, help='trek data file (default: trekdata.txt)')
+    parser.add_argument('--prune', action='store_true',
+                        help='delete treks that are no longer in trekdata.txt (unless users reference them)')
+    args = parser.parse_args()
     print("🚀 Starting trek data import...")
-    print("This will import all 28 treks with complete information")
-    insert_data()
+    insert_data(prune=args.prune, path=args.source)
     print("✅ Import completed successfully!")
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Process the catalog's trek images in parallel and record them on the treks
+
+For every trek whose image is a catalog image (its image_filename, or the
+TREK_IMAGE_FILES entry for its name when it has none), this copies the file
+from --source into static/trekimages under a content-hashed name
+(rajgad.jpg -> rajgad.1a2b3c4d.jpg), writes the responsive WebP/AVIF variants
+and the list thumbnail, and stores that name in Trek.image_filename. An image
+replaced under the same source name therefore gets new URLs for itself and
+its variants, so nothing cached under the old ones (or fingerprinted by
+build_static.py) is served for it; the previous copy is removed. Images are
+processed in a process pool, one per core by default. Source hashes are kept
+in TREK_IMAGE_MANIFEST, so unchanged images are skipped on the next run.
+Uploaded trek images (blobs, remote URLs) are left to the upload pipeline.
+
+Run it after loading a catalog, e.g.
+    python import_trek_images.py --source /path/to/trekimages
+    python catalog_snapshot.py import catalog.jsonl.gz --images /path/to/trekimages
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from sqlalchemy import select, update
+
+from app import (
+    app, db, Trek, BLOB_NAME, LEGACY_UPLOAD_NAME, IMAGE_VARIANT_FORMATS,
+    THUMB_FOLDER, TREK_IMAGE_FILES, TREK_IMAGE_FOLDER, TREK_IMAGE_MANIFEST,
+    TREK_VARIANT_FOLDER, generate_image_variants, generate_thumbnail, _is_url,
+)
+
+HASH_CHUNK = 1024 * 1024
+UPDATE_CHUNK = 500
+FINGERPRINT_LENGTH = 8
+# rajgad.1a2b3c4d.jpg -> rajgad.jpg
+FINGERPRINTED_NAME = re.compile(r'^(.+)\.[0-9a-f]{%d}(\.[^.]+)$' % FINGERPRINT_LENGTH)
+
+
+def file_digest(path):
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprinted_name(name, digest):
+    """Stored filename for a catalog image, e.g. rajgad.jpg -> rajgad.1a2b3c4d.jpg"""
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{digest[:FINGERPRINT_LENGTH]}{ext}"
+
+
+def source_name(stored):
+    """Catalog (source) filename of a stored image name"""
+    match = FINGERPRINTED_NAME.match(stored)
+    return match.group(1) + match.group(2) if match else stored
+
+
+def _outputs_exist(entry):
+    return (os.path.exists(os.path.join(TREK_IMAGE_FOLDER, entry['stored']))
+            and all(os.path.exists(os.path.join(TREK_VARIANT_FOLDER, name)) for name in entry['variants'])
+            and (not entry['thumbnail'] or os.path.exists(os.path.join(THUMB_FOLDER, entry['thumbnail']))))
+
+
+def remove_outputs(entry):
+    """Delete a manifest entry's stored copy, variants and thumbnail"""
+    paths = [os.path.join(TREK_VARIANT_FOLDER, name) for name in entry['variants']]
+    if entry.get('stored'):
+        paths.append(os.path.join(TREK_IMAGE_FOLDER, entry['stored']))
+    if entry['thumbnail']:
+        paths.append(os.path.join(THUMB_FOLDER, entry['thumbnail']))
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def process_trek_image(src_path, previous=None):
+    """Worker-process entry point: (re)build one catalog image if it changed
+
+    Returns (manifest entry, whether anything was written). `previous` is the
+    image's last manifest entry; its outputs are left for the caller to remove
+    once no trek points at them.
+    """
+    start = time.perf_counter()
+    digest = file_digest(src_path)
+    name = fingerprinted_name(os.path.basename(src_path), digest)
+    if (previous and previous['sha256'] == digest and previous.get('stored') == name
+            and _outputs_exist(previous)):
+        return previous, False
+
+    stored = os.path.join(TREK_IMAGE_FOLDER, name)
+    tmp_path = os.path.join(TREK_IMAGE_FOLDER, f".{name}.tmp")
+    shutil.copyfile(src_path, tmp_path)
+    os.replace(tmp_path, stored)
+    variants = generate_image_variants(stored)
+    thumbnail = generate_thumbnail(stored)
+    return {
+        'sha256': digest,
+        'stored': name,
+        'variants': variants,
+        'thumbnail': thumbnail,
+        'seconds': round(time.perf_counter() - start, 3),
+    }, True
+
+
+def load_manifest():
+    try:
+        with open(TREK_IMAGE_MANIFEST, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(manifest):
+    os.makedirs(os.path.dirname(TREK_IMAGE_MANIFEST), exist_ok=True)
+    tmp_path = TREK_IMAGE_MANIFEST + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, TREK_IMAGE_MANIFEST)
+
+
+def catalog_image(trek_name, image_filename):
+    """Catalog (source) image filename for a trek, or None (no image / an uploaded one)"""
+    if image_filename:
+        if _is_url(image_filename) or BLOB_NAME.match(image_filename) or LEGACY_UPLOAD_NAME.match(image_filename):
+            return None
+        return source_name(image_filename)
+    return TREK_IMAGE_FILES.get(trek_name)
+
+
+def import_images(source=TREK_IMAGE_FOLDER, workers=None, force=False):
+    """Process every image the catalog references; returns a stats dict"""
+    if not IMAGE_VARIANT_FORMATS:
+        print("Pillow with WebP/AVIF support is required; nothing to do.")
+        return {}
+    start = time.perf_counter()
+
+    # image filename -> [(trek id, current image_filename)]
+    wanted = {}
+    for trek_id, name, image_filename in db.session.execute(select(Trek.id, Trek.name, Trek.image_filename)):
+        image = catalog_image(name, image_filename)
+        if image:
+            wanted.setdefault(image, []).append((trek_id, image_filename))
+
+    sources, missing = {}, []
+    for image in wanted:
+        for folder in (source, TREK_IMAGE_FOLDER):
+            path = os.path.join(folder, image)
+            if os.path.isfile(path):
+                sources[image] = path
+                break
+        else:
+            missing.append(image)
+
+    manifest = load_manifest()
+    os.makedirs(TREK_IMAGE_FOLDER, exist_ok=True)
+    changed, failed, superseded = set(), [], []
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {
+            pool.submit(process_trek_image, path, None if force else manifest.get(image)): image
+            for image, path in sources.items()
+        }
+        for future in as_completed(futures):
+            image = futures[future]
+            try:
+                entry, written = future.result()
+            except Exception as e:
+                print(f"  ! {image}: {e}")
+                failed.append(image)
+                continue
+            previous = manifest.get(image)
+            manifest[image] = entry
+            if written:
+                changed.add(image)
+                if previous and previous.get('stored') != entry['stored']:
+                    superseded.append(previous)
+                print(f"  - {image}: {len(entry['variants'])} variants + thumbnail in {entry['seconds']:.1f}s")
+    # Point treks at their processed image; bump updated_at so page ETags change
+    now = datetime.utcnow()
+    updates = [
+        {'id': trek_id, 'image_filename': manifest[image]['stored'], 'updated_at': now}
+        for image, treks in wanted.items()
+        if image in manifest and image not in failed and manifest[image].get('stored')
+        for trek_id, current in treks
+        if current != manifest[image]['stored'] or image in changed
+    ]
+    for offset in range(0, len(updates), UPDATE_CHUNK):
+        db.session.execute(update(Trek), updates[offset:offset + UPDATE_CHUNK])
+    db.session.commit()
+    save_manifest(manifest)
+
+    # Replaced images: the old copy, variants and thumbnail are unreferenced now
+    # (a smaller replacement may also have fewer widths)
+    for previous in superseded:
+        remove_outputs(previous)
+
+    stats = {
+        'images': len(sources),
+        'processed': len(changed),
+        'unchanged': len(sources) - len(changed) - len(failed),
+        'failed': len(failed),
+        'missing': len(missing),
+        'treks_updated': len(updates),
+    }
+    print(f"Images: {stats['processed']} processed, {stats['unchanged']} unchanged, "
+          f"{stats['failed']} failed, {stats['missing']} missing; "
+          f"{stats['treks_updated']} treks updated in {time.perf_counter() - start:.1f}s")
+    for image in sorted(missing):
+        print(f"  ? {image} not found in {source}")
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Process catalog trek images and record them on the treks')
+    parser.add_argument('--source', default=TREK_IMAGE_FOLDER,
+                        help='folder with the catalog images (default: static/trekimages)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per core)')
+    parser.add_argument('--force', action='store_true', help='reprocess images even if unchanged')
+    args = parser.parse_args()
+
+    with app.app_context():
+        import_images(args.source, args.workers, args.force)
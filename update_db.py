@@ -1,26 +1,58 @@
-import sqlite3
-
-# Connect to the database
-conn = sqlite3.connect('trekmate.db')
-cursor = conn.cursor()
-
-# Add the image_filename column to the treks table
-try:
-    cursor.execute('ALTER TABLE treks ADD COLUMN image_filename TEXT')
-    print("Successfully added image_filename column to treks table")
-except sqlite3.OperationalError as e:
-    print(f"treks.image_filename: {e}")
-
-# Add trek_status to trek_posts table
-try:
-    cursor.execute('ALTER TABLE trek_posts ADD COLUMN trek_status TEXT')
-    print("Successfully added trek_status column to trek_posts table")
-except sqlite3.OperationalError as e:
-    print(f"trek_posts.trek_status: {e}")
-
-# Commit the changes and close the connection
-conn.commit()
-conn.close()
+"""
+Bring an existing database up to the current models
+
+Runs against the app's configured database (DATABASE_URL, or the local
+trekmate.db), so it works for SQLite and Postgres deployments alike. Safe to
+run repeatedly: columns that already exist are skipped.
+"""
+from sqlalchemy import inspect, text
+
+from app import app, db, rebuild_rating_stats
+
+# (table, column, DDL type) for columns added after the table was first created
+NEW_COLUMNS = (
+    ('treks', 'image_filename', 'TEXT'),
+    # Drives trek page ETags
+    ('treks', 'updated_at', 'TIMESTAMP'),
+    ('trek_posts', 'trek_status', 'VARCHAR(20)'),
+    # Remote upload staging
+    ('upload_blobs', 'kind', 'VARCHAR(20)'),
+    ('upload_blobs', 'remote_status', 'VARCHAR(20)'),
+    ('upload_blobs', 'remote_attempts', 'INTEGER NOT NULL DEFAULT 0'),
+    ('upload_blobs', 'remote_attempted_at', 'TIMESTAMP'),
+)
+
+
+def add_missing_columns(conn):
+    inspector = inspect(conn)
+    for table, column, ddl in NEW_COLUMNS:
+        if not inspector.has_table(table):
+            # create_all() below creates it with every column
+            continue
+        if column in {c['name'] for c in inspector.get_columns(table)}:
+            print(f"{table}.{column}: already present")
+            continue
+        conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+        print(f"Successfully added {column} column to {table} table")
+
+
+with app.app_context():
+    with db.engine.begin() as conn:
+        add_missing_columns(conn)
+
+    # Creates new tables (trek_rating_stats, ...) and their indexes
+    db.create_all()
+
+    # Index for paging a trek's reviews newest first (create_all skips existing tables)
+    with db.engine.begin() as conn:
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_trek_comments_trek_created '
+                          'ON trek_comments (trek_id, created_at, id)'))
+    print("Ensured ix_trek_comments_trek_created index on trek_comments")
+
+    # Backfill the rating aggregates from the existing comments
+    treks = rebuild_rating_stats()
+    db.session.commit()
+    print(f"Rebuilt rating aggregates for {treks} treks")
 
 # from app import app, db, User
 
@@ -28,4 +60,4 @@ conn.close()
 #     user = db.session.get(User, 11)  # or: User.query.get(11)
 #     if user:
 #         user.name = "Admin - Adilb0t"
-#         db.session.commit()
\ No newline at end of file
+#         db.session.commit()